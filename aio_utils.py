@@ -0,0 +1,68 @@
+# aio_utils.py
+# Small asyncio helpers shared by the bot modules.
+import asyncio
+from typing import Any, Awaitable, Callable, Dict
+
+# The loop only keeps weak refs to tasks; hold fire-and-forget ones here until done.
+_BG_TASKS: "set[asyncio.Task]" = set()
+
+def spawn(coro) -> asyncio.Task:
+    t = asyncio.create_task(coro)
+    _BG_TASKS.add(t)
+    t.add_done_callback(_BG_TASKS.discard)
+    return t
+
+async def single_flight(inflight: Dict[Any, asyncio.Task], key, factory: Callable[[], Awaitable]):
+    """
+    Concurrent callers asking for the same key share one in-flight task.
+    Each module passes its own `inflight` dict, so equal keys in different modules never collide.
+    """
+    task = inflight.get(key)
+    if task is None:
+        task = asyncio.ensure_future(factory())
+        inflight[key] = task
+        task.add_done_callback(lambda _t: inflight.pop(key, None))
+    # shield: one caller being cancelled must not cancel the others' request
+    return await asyncio.shield(task)
+
+def _usable(task: asyncio.Task):
+    if task.cancelled() or task.exception() is not None:
+        return None
+    return task.result() or None
+
+async def first_by_priority(coros, grace: float):
+    """
+    Run coros concurrently and return the best truthy result, preferring earlier ones.
+    A lower-priority answer that is already in hand is returned once the higher-priority
+    sources have failed, or after `grace` seconds if they are still running. None if all fail.
+    Tasks still running on return are cancelled.
+    """
+    tasks = [asyncio.ensure_future(c) for c in coros]
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + grace
+    try:
+        while True:
+            fallback = None
+            blocked = False
+            for task in tasks:
+                if not task.done():
+                    blocked = True
+                    continue
+                result = _usable(task)
+                if result is not None:
+                    if not blocked:
+                        return result  # every higher-priority source has already failed
+                    fallback = fallback or result
+            if not blocked:
+                return None
+            remaining = deadline - loop.time()
+            if fallback is not None and remaining <= 0:
+                return fallback
+            await asyncio.wait(
+                [t for t in tasks if not t.done()],
+                timeout=remaining if fallback is not None else None,
+                return_when=asyncio.FIRST_COMPLETED,
+            )
+    finally:
+        for task in tasks:
+            task.cancel()
@@ -1,6 +1,11 @@
 # bot.py
 import os
-from telegram.ext import ApplicationBuilder
+import queue
+import atexit
+import logging
+import logging.handlers
+from telegram.ext import ApplicationBuilder, AIORateLimiter, PicklePersistence
+from telegram.request import HTTPXRequest
 
 from moderation import register_moderation   # moderation + help menu + spam + joins/leaves
 from buy_tracker import register_buytracker          # your existing module
@@ -9,10 +14,65 @@ from x_alert import register_x_alert                 # your existing module
 
 TOKEN = os.getenv("BOT_TOKEN")
 
+# Telegram flood limits: ~30 msg/s per bot, 20 msg/min per group.
+# Every bot call goes through this limiter, so handlers can send freely.
+RATE_LIMITER = AIORateLimiter(
+    overall_max_rate=28,
+    overall_time_period=1,
+    group_max_rate=18,
+    group_time_period=60,
+    max_retries=2,
+)
+
+# Updates are handled concurrently, but never more than this many at once
+MAX_CONCURRENT_UPDATES = int(os.getenv("MAX_CONCURRENT_UPDATES", "32"))
+POLL_TIMEOUT_SEC = 25  # long-poll window for getUpdates
+
+# Outbound Bot API calls share one pooled HTTP/2 client so concurrent handlers
+# don't queue behind a single connection; getUpdates gets its own connection.
+API_POOL_SIZE = int(os.getenv("API_POOL_SIZE", "64"))
+
+# chat_data/user_data (e.g. moderation warnings) are pickled here, flushed every minute
+STATE_PATH = os.getenv("STATE_PATH", "bot_state.pkl")
+PERSISTENCE_FLUSH_SEC = 60
+
+# Webhook mode (set USE_WEBHOOK=1): Telegram pushes updates to https://<WEBHOOK_HOST>/<BOT_TOKEN>
+USE_WEBHOOK = os.getenv("USE_WEBHOOK", "").lower() in ("1", "true", "yes")
+WEBHOOK_HOST = os.getenv("WEBHOOK_HOST")
+WEBHOOK_SECRET = os.getenv("WEBHOOK_SECRET")
+PORT = int(os.getenv("PORT", "8443"))
+
+def _queue_logging():
+    """Route every log record through a queue; a background thread does the (blocking) stream writes."""
+    root = logging.getLogger()
+    handlers = root.handlers[:] or [logging.StreamHandler()]
+    q: "queue.SimpleQueue" = queue.SimpleQueue()
+    for h in handlers:
+        root.removeHandler(h)
+    root.addHandler(logging.handlers.QueueHandler(q))
+    listener = logging.handlers.QueueListener(q, *handlers, respect_handler_level=True)
+    listener.start()
+    atexit.register(listener.stop)
+
 def main():
     if not TOKEN:
         raise RuntimeError("BOT_TOKEN env var is missing")
-    app = ApplicationBuilder().token(TOKEN).build()
+    _queue_logging()
+    try:
+        import uvloop  # faster event loop for all the socket work; not available on Windows
+        uvloop.install()
+    except ImportError:
+        pass
+    app = (
+        ApplicationBuilder()
+        .token(TOKEN)
+        .rate_limiter(RATE_LIMITER)
+        .persistence(PicklePersistence(filepath=STATE_PATH, update_interval=PERSISTENCE_FLUSH_SEC))
+        .concurrent_updates(MAX_CONCURRENT_UPDATES)
+        .request(HTTPXRequest(connection_pool_size=API_POOL_SIZE, http_version="2", read_timeout=30))
+        .get_updates_request(HTTPXRequest(http_version="2", read_timeout=30, connect_timeout=10))
+        .build()
+    )
 
     # Core moderation/features
     register_moderation(app)
@@ -22,7 +82,18 @@ def main():
     register_selltracker(app)
     register_x_alert(app)
 
-    app.run_polling()
+    if USE_WEBHOOK:
+        if not WEBHOOK_HOST:
+            raise RuntimeError("USE_WEBHOOK is set but WEBHOOK_HOST env var is missing")
+        app.run_webhook(
+            listen="0.0.0.0",
+            port=PORT,
+            url_path=TOKEN,
+            webhook_url=f"https://{WEBHOOK_HOST}/{TOKEN}",
+            secret_token=WEBHOOK_SECRET,
+        )
+    else:
+        app.run_polling(timeout=POLL_TIMEOUT_SEC)
 
 if __name__ == "__main__":
     main()
@@ -5,10 +5,16 @@ import logging
 import json
 import aiohttp
 import asyncio
+import orjson
 import time
 import secrets
 import re
-from typing import Dict, Optional, Any, List
+import threading
+from html import escape
+from collections import OrderedDict
+from functools import lru_cache
+from cachetools import TTLCache
+from typing import Dict, Optional, Any, List, Tuple
 
 from telegram import (
     Update,
@@ -24,6 +30,8 @@ from telegram.ext import (
     ApplicationHandlerStop,   # used in the DM gate
 )
 
+from aio_utils import spawn, single_flight, first_by_priority
+
 # ---------------- SETTINGS ----------------
 HELIUS_API_KEY = os.getenv("HELIUS_API_KEY")
 HELIUS_HTTP_URL = f"https://mainnet.helius-rpc.com/?api-key={HELIUS_API_KEY}" if HELIUS_API_KEY else None
@@ -32,6 +40,11 @@ HELIUS_WS_URL   = f"wss://mainnet.helius-rpc.com/?api-key={HELIUS_API_KEY}" if H
 DEXSCREENER_TOKENS_URL = "https://api.dexscreener.com/latest/dex/tokens/{}"
 DEXSCREENER_TRADES_URL = "https://api.dexscreener.com/latest/dex/trades/{}"
 PUMPFUN_URL = "https://api.pump.fun/v1/token/{}"   # best-effort (may fail)
+# link prefixes for alert buttons; only the address/txid is appended per alert
+DEXSCREENER_PAGE_URL = "https://dexscreener.com/solana/"
+JUP_SWAP_URL = "https://jup.ag/swap/SOL-"
+SOLSCAN_TX_URL = "https://solscan.io/tx/"
+SOLSCAN_TOKEN_URL = "https://solscan.io/token/"
 
 DB_PATH = "tracked_tokens.db"
 logging.basicConfig(level=logging.INFO)
@@ -40,8 +53,10 @@ DEFAULT_MIN_BUY_USD = 5.0
 DEFAULT_EMOJI = "👀"
 
 PAIR_CODE_TTL_SEC = 10 * 60  # 10 minutes
+PAIR_CODE_SWEEP_SEC = 60
 
 NATIVE_SOL_MINTS = {"So11111111111111111111111111111111111111112"}
+_NATIVE_SOL_SQL = f"mint NOT IN ({', '.join('?' * len(NATIVE_SOL_MINTS))})"  # bind with tuple(NATIVE_SOL_MINTS)
 
 # ---------------- PROGRAM IDS + TOGGLES ----------------
 # Hard-coded mainnet defaults (can be overridden by env)
@@ -72,9 +87,16 @@ PUMPFUN_PROGRAM_IDS: List[str] = _split_env("PUMPFUN_PROGRAM_IDS") or (
 # If you want to include routers/aggregators (like Jupiter), add to env: AGGREGATOR_PROGRAM_IDS="JUPw...,..."
 AGGREGATOR_PROGRAM_IDS: List[str] = _split_env("AGGREGATOR_PROGRAM_IDS")
 
+# a Pump.fun notification that also touches a Raydium program may be the graduation (pool creation) tx
+_RAYDIUM_PROGRAMS = frozenset(RAYDIUM_PROGRAM_IDS)
+# after graduation, DexScreener can take a while to index the pool; look it up at these offsets (s)
+PROMOTE_RETRY_DELAYS = (15, 30, 60, 120)
+
 # ---------------- PAIRING CODES (Group → DM) ----------------
-# code -> {"origin_chat_id": int, "user_id": int, "ts": float}
-PAIR_CODES: Dict[str, Dict] = {}
+# code -> {"origin_chat_id": int, "user_id": int, "ts": monotonic float}; insertion order == expiry order
+# (fixed TTL), so the dict itself acts as the expiry queue — no separate heap needed
+PAIR_CODES: "OrderedDict[str, Dict]" = OrderedDict()
+PAIR_CODES_MAX = 10_000
 
 def _gen_pair_code() -> str:
     for _ in range(20):
@@ -84,13 +106,28 @@ def _gen_pair_code() -> str:
     return f"{secrets.randbelow(900000) + 100000}"
 
 def _put_code(code: str, origin_chat_id: int, user_id: int):
-    PAIR_CODES[code] = {"origin_chat_id": origin_chat_id, "user_id": user_id, "ts": time.time()}
+    PAIR_CODES[code] = {"origin_chat_id": origin_chat_id, "user_id": user_id, "ts": time.monotonic()}
+    PAIR_CODES.move_to_end(code)
+    while len(PAIR_CODES) > PAIR_CODES_MAX:
+        PAIR_CODES.popitem(last=False)
+
+def _sweep_pair_codes():
+    # oldest first, so stop at the first code that is still valid
+    now = time.monotonic()
+    while PAIR_CODES:
+        data = next(iter(PAIR_CODES.values()))
+        if now - data["ts"] <= PAIR_CODE_TTL_SEC:
+            break
+        PAIR_CODES.popitem(last=False)
+
+async def sweep_pair_codes(context: ContextTypes.DEFAULT_TYPE):
+    _sweep_pair_codes()
 
 def _pop_valid_code(code: str, user_id: int) -> Optional[int]:
     data = PAIR_CODES.get(code)
     if not data:
         return None
-    if time.time() - data["ts"] > PAIR_CODE_TTL_SEC:
+    if time.monotonic() - data["ts"] > PAIR_CODE_TTL_SEC:
         PAIR_CODES.pop(code, None)
         return None
     if data["user_id"] != user_id:
@@ -99,179 +136,386 @@ def _pop_valid_code(code: str, user_id: int) -> Optional[int]:
     return int(data["origin_chat_id"])
 
 # ---------------- DB ----------------
+# One shared autocommit connection in WAL mode; the lock serialises use across threads.
+_db: Optional[sqlite3.Connection] = None
+_db_lock = threading.Lock()
+
+def _conn() -> sqlite3.Connection:
+    global _db
+    if _db is None:
+        _db = sqlite3.connect(DB_PATH, check_same_thread=False, isolation_level=None)
+        _db.execute("PRAGMA journal_mode=WAL")
+        _db.execute("PRAGMA synchronous=NORMAL")
+        _db.execute("PRAGMA temp_store=MEMORY")
+        _db.execute("PRAGMA mmap_size=268435456")
+        _db.execute("PRAGMA busy_timeout=5000")
+    return _db
+
 def init_db():
-    conn = sqlite3.connect(DB_PATH)
-    c = conn.cursor()
-    c.execute(
-        """
-        CREATE TABLE IF NOT EXISTS tracked_tokens (
-            chat_id INTEGER NOT NULL,
-            mint TEXT NOT NULL,
-            symbol TEXT,
-            media_file_id TEXT,
-            emoji TEXT,
-            total_supply REAL,
-            min_buy_usd REAL,
-            socials_json TEXT,
-            active INTEGER DEFAULT 0,
-            PRIMARY KEY (chat_id, mint)
+    with _db_lock:
+        _conn().execute(
+            """
+            CREATE TABLE IF NOT EXISTS tracked_tokens (
+                chat_id INTEGER NOT NULL,
+                mint TEXT NOT NULL,
+                symbol TEXT,
+                media_file_id TEXT,
+                emoji TEXT,
+                total_supply REAL,
+                min_buy_usd REAL,
+                socials_json TEXT,
+                active INTEGER DEFAULT 0,
+                PRIMARY KEY (chat_id, mint)
+            )
+            """
         )
-        """
-    )
-    conn.commit()
-    conn.close()
+        # migrations (safe no-ops if already exist): fallback poll cursor
+        cols = {row[1] for row in _conn().execute("PRAGMA table_info(tracked_tokens)").fetchall()}
+        if "pair_addr" not in cols:
+            _conn().execute("ALTER TABLE tracked_tokens ADD COLUMN pair_addr TEXT")
+        if "last_txid" not in cols:
+            _conn().execute("ALTER TABLE tracked_tokens ADD COLUMN last_txid TEXT")
 
 def upsert_token(chat_id: int, mint: str, **fields):
-    conn = sqlite3.connect(DB_PATH)
-    c = conn.cursor()
-    c.execute(
-        "INSERT OR IGNORE INTO tracked_tokens(chat_id, mint, min_buy_usd) VALUES(?, ?, ?)",
-        (chat_id, mint, DEFAULT_MIN_BUY_USD),
-    )
+    if is_native_sol(mint):
+        logging.warning(f"upsert_token: refusing native SOL for chat {chat_id}")
+        return
+    # single statement: new rows get DEFAULT_MIN_BUY_USD unless given; existing rows only take `fields`
+    row = {"min_buy_usd": DEFAULT_MIN_BUY_USD, **fields}
+    cols = ", ".join(["chat_id", "mint", *row.keys()])
+    marks = ", ".join("?" * (len(row) + 2))
     if fields:
-        cols = ", ".join([f"{k}=?" for k in fields.keys()])
-        vals = list(fields.values())
-        vals.extend([chat_id, mint])
-        c.execute(f"UPDATE tracked_tokens SET {cols} WHERE chat_id=? AND mint=?", vals)
-    conn.commit()
-    conn.close()
-
-def set_active(chat_id: int, mint: str, active: bool):
-    upsert_token(chat_id, mint, active=1 if active else 0)
+        sets = ", ".join(f"{k}=excluded.{k}" for k in fields)
+        conflict = f"DO UPDATE SET {sets}"
+    else:
+        conflict = "DO NOTHING"
+    global _active_rows
+    with _db_lock:
+        _conn().execute(
+            f"INSERT INTO tracked_tokens({cols}) VALUES({marks}) ON CONFLICT(chat_id, mint) {conflict}",
+            (chat_id, mint, *row.values()),
+        )
+        _active_rows = None
 
 def remove_token(chat_id: int, mint: str):
-    conn = sqlite3.connect(DB_PATH)
-    c = conn.cursor()
-    c.execute("DELETE FROM tracked_tokens WHERE chat_id=? AND mint=?", (chat_id, mint))
-    conn.commit()
-    conn.close()
+    global _active_rows
+    with _db_lock:
+        _conn().execute("DELETE FROM tracked_tokens WHERE chat_id=? AND mint=?", (chat_id, mint))
+        _active_rows = None
 
 def list_tokens_rows(chat_id: int):
-    conn = sqlite3.connect(DB_PATH)
-    c = conn.cursor()
-    c.execute(
-        "SELECT mint, symbol, media_file_id, emoji, total_supply, min_buy_usd, socials_json, active FROM tracked_tokens WHERE chat_id=?",
-        (chat_id,),
-    )
-    rows = c.fetchall()
-    conn.close()
-    return rows
+    with _db_lock:
+        return _conn().execute(
+            "SELECT mint, symbol, media_file_id, emoji, total_supply, min_buy_usd, socials_json, active FROM tracked_tokens WHERE chat_id=?",
+            (chat_id,),
+        ).fetchall()
 
 def get_token_row(chat_id: int, mint: str) -> Optional[tuple]:
-    conn = sqlite3.connect(DB_PATH)
-    c = conn.cursor()
-    c.execute(
-        "SELECT mint, symbol, media_file_id, emoji, total_supply, min_buy_usd, socials_json, active FROM tracked_tokens WHERE chat_id=? AND mint=?",
-        (chat_id, mint),
-    )
-    row = c.fetchone()
-    conn.close()
-    return row
+    with _db_lock:
+        return _conn().execute(
+            "SELECT mint, symbol, media_file_id, emoji, total_supply, min_buy_usd, socials_json, active FROM tracked_tokens WHERE chat_id=? AND mint=?",
+            (chat_id, mint),
+        ).fetchone()
+
+# In-memory copy of the active rows; every tracked_tokens write resets it to None (re-read on next use)
+_active_rows: Optional[List[tuple]] = None
+
+def _load_active_rows():
+    global _active_rows
+    with _db_lock:
+        if _active_rows is None:
+            _active_rows = _conn().execute("""
+                SELECT chat_id, mint, media_file_id, symbol, emoji, min_buy_usd, socials_json, active, pair_addr, last_txid
+                FROM tracked_tokens WHERE active=1 AND {}
+            """.format(_NATIVE_SOL_SQL), tuple(NATIVE_SOL_MINTS)).fetchall()
+        return _active_rows
+
+def save_fallback_cursors(batch: List[tuple]):
+    """batch: [(pair_addr, last_txid, chat_id, mint), ...] written in one transaction."""
+    global _active_rows
+    with _db_lock:
+        c = _conn()
+        c.execute("BEGIN")
+        try:
+            c.executemany("UPDATE tracked_tokens SET pair_addr=?, last_txid=? WHERE chat_id=? AND mint=?", batch)
+            c.execute("COMMIT")
+        except Exception:
+            c.execute("ROLLBACK")
+            raise
+        # cursors only move forward, so patch them into the cached rows instead of re-reading
+        if _active_rows is not None:
+            moved = {(chat_id, mint): (pair, txid) for pair, txid, chat_id, mint in batch}
+            _active_rows = [
+                (*row[:8], *moved[row[0], row[1]]) if (row[0], row[1]) in moved else row
+                for row in _active_rows
+            ]
 
 # ---------------- HELPERS ----------------
 def is_native_sol(mint: str) -> bool:
     return mint in NATIVE_SOL_MINTS
 
-def fmt_amount(x):
-    try:
-        n = float(x or 0)
-        if n == 0:
-            return "0"
-        if n < 1:
-            return f"{n:.6f}".rstrip("0").rstrip(".")
-        if n < 1000:
-            return f"{n:.4f}".rstrip("0").rstrip(".")
+def fmt_amount(n: float) -> str:
+    if n >= 1000:
         return f"{n:,.2f}"
-    except Exception:
-        return str(x)
+    if n == 0:
+        return "0"
+    return (f"{n:.4f}" if n >= 1 else f"{n:.6f}").rstrip("0").rstrip(".")
 
-def fmt_usd(x):
-    try:
-        n = float(x or 0)
-        return f"${n:,.2f}"
-    except Exception:
-        return f"${x}"
-
-def short_wallet(addr: str) -> str:
-    if not addr or len(addr) < 8:
-        return addr or "?"
-    return addr[:4] + "..." + addr[-4:]
+def fmt_usd(n: float) -> str:
+    return f"${n:,.2f}"
 
+@lru_cache(maxsize=4096)  # the same tracked mints are shortened over and over
 def short_mint(mint: str) -> str:
     if not mint or len(mint) <= 10:
         return mint or "?"
-    return mint[:4] + "…" + mint[-4:]
+    return f"{mint[:4]}…{mint[-4:]}"
+
+_ALERT_TEMPLATE = (
+    "{emoji} | {symbol} BUY!\n"
+    "🔷 ~USD {usd}\n"
+    "🪙 {symbol} {amount}\n"
+    "🔎 Position: New Holder [Unknown]({tx})\n"
+    "📈 MCap: {mcap}{socials}\n"
+    "[Tx]({tx})"
+).format
+_SOCIAL_LABELS = (("x", "X"), ("instagram", "IG"), ("website", "Web"))
+
+def _parse_socials(socials_json: Optional[str]) -> dict:
+    try:
+        soc = json.loads(socials_json) if socials_json else {}
+        return soc if isinstance(soc, dict) else {}
+    except Exception:
+        return {}
+
+def _render_socials(soc: dict) -> str:
+    parts = [f"[{label}]({soc[key]})" for key, label in _SOCIAL_LABELS if soc.get(key)]
+    return " " + " • ".join(parts) if parts else ""
+
+def _render_alert(emoji: str, symbol: str, usd: float, amount: str, tx_url: str, mcap: float, socials: str) -> str:
+    return _ALERT_TEMPLATE(
+        emoji=emoji, symbol=symbol, usd=fmt_usd(usd), amount=amount, tx=tx_url, mcap=fmt_usd(mcap), socials=socials
+    )
+
+def _alert_markup(dexs: str, jup: str, tx_url: str) -> InlineKeyboardMarkup:
+    return InlineKeyboardMarkup((
+        (InlineKeyboardButton("📊 Dex", url=dexs), InlineKeyboardButton("💲 Buy", url=jup)),
+        (InlineKeyboardButton("Txn", url=tx_url),),
+    ))
 
 # ---------------- EXTERNAL LOOKUPS (HTTP) ----------------
+# One keep-alive session for every Pump.fun/DexScreener lookup (closed on shutdown)
+_http: Optional[aiohttp.ClientSession] = None
+
+# Short timeouts bound the tail; a slow source is skipped rather than waited on
+HTTP_TIMEOUT = aiohttp.ClientTimeout(total=3, connect=1)
+HTTP_RETRIES = 2  # extra attempts for 429/5xx/connection errors; timeouts and other 4xx are final
+_RETRY_STATUSES = frozenset((429, 500, 502, 503, 504))
+
+async def _get_http() -> aiohttp.ClientSession:
+    global _http
+    if _http is None or _http.closed:
+        _http = aiohttp.ClientSession(
+            connector=aiohttp.TCPConnector(limit=64, ttl_dns_cache=300, keepalive_timeout=60),
+            timeout=HTTP_TIMEOUT,
+        )
+    return _http
+
+async def _close_http():
+    if _http is not None and not _http.closed:
+        await _http.close()
+
+def _fast_retry_delay(attempt: int, retry_after=None) -> float:
+    """Short backoff for the 3s-budget price calls: 0.2s * 2^attempt, Retry-After capped at 2s."""
+    try:
+        delay = min(2.0, float(retry_after)) if retry_after else 0.2 * 2 ** attempt
+    except ValueError:  # HTTP-date form
+        delay = 0.2 * 2 ** attempt
+    return delay + secrets.randbelow(100) / 1000
+
+async def _get(url: str, params: Optional[dict] = None, headers: Optional[dict] = None) -> Tuple[int, Any, Any]:
+    """
+    GET with backoff on 429/5xx. Returns (status, response headers, parsed JSON or None);
+    status is 0 when no response arrived.
+    """
+    session = await _get_http()
+    for attempt in range(HTTP_RETRIES + 1):
+        retry_after = None
+        try:
+            async with session.get(url, params=params, headers=headers) as resp:
+                if resp.status not in _RETRY_STATUSES or attempt == HTTP_RETRIES:
+                    data = await resp.json(content_type=None) if resp.status == 200 else None
+                    return resp.status, resp.headers, data
+                retry_after = resp.headers.get("Retry-After")
+        except asyncio.TimeoutError:
+            return 0, None, None
+        except aiohttp.ClientConnectionError:
+            if attempt == HTTP_RETRIES:
+                return 0, None, None
+        await asyncio.sleep(_fast_retry_delay(attempt, retry_after))
+    return 0, None, None
+
+TOKEN_INFO_TTL = 15  # seconds; Pump.fun prices move fast pre-listing, so keep this short
+_info_cache: Dict[str, Tuple[float, dict]] = {}  # mint -> (monotonic ts, info)
+
 async def fetch_token_info(mint: str):
-    # 1) Pump.fun
+    hit = _info_cache.get(mint)
+    if hit and time.monotonic() - hit[0] < TOKEN_INFO_TTL:
+        return hit[1]
+    # concurrent misses for one mint (a burst of buys) share a single lookup
+    info = await single_flight(_inflight, ("info", mint), lambda: _fetch_token_info_uncached(mint))
+    if info is not None:
+        _info_cache[mint] = (time.monotonic(), info)
+        return info
+    return {"symbol": "TOKEN", "price": 0, "mc": 0, "name": "TOKEN"}
+
+async def _info_pumpfun(mint: str) -> Optional[dict]:
     try:
-        async with aiohttp.ClientSession() as session:
-            async with session.get(PUMPFUN_URL.format(mint)) as resp:
-                if resp.status == 200:
-                    data = await resp.json()
-                    d = data.get("data") or {}
-                    if d:
-                        return {
-                            "symbol": d.get("symbol", "TOKEN"),
-                            "price": float(d.get("price", 0) or 0),
-                            "mc": float(d.get("marketCap", 0) or 0),
-                            "name": d.get("name") or d.get("symbol") or "TOKEN",
-                        }
+        _, _, data = await _get(PUMPFUN_URL.format(mint))
+        d = (data or {}).get("data") or {}
+        if d:
+            return {
+                "symbol": d.get("symbol", "TOKEN"),
+                "price": float(d.get("price", 0) or 0),
+                "mc": float(d.get("marketCap", 0) or 0),
+                "name": d.get("name") or d.get("symbol") or "TOKEN",
+            }
     except Exception:
         pass
+    return None
 
-    # 2) DexScreener
+async def _info_dexscreener(mint: str) -> Optional[dict]:
     try:
-        async with aiohttp.ClientSession() as session:
-            async with session.get(DEXSCREENER_TOKENS_URL.format(mint)) as resp:
-                if resp.status == 200:
-                    data = await resp.json()
-                    pairs = data.get("pairs", []) or []
-                    if pairs:
-                        pair = pairs[0]
-                        price_usd = float(pair.get("priceUsd", 0) or 0)
-                        fdv = float(pair.get("fdv", 0) or 0)
-                        base = (pair.get("baseToken") or {})
-                        symbol = base.get("symbol", "TOKEN")
-                        name = base.get("name") or symbol or "TOKEN"
-                        return {"symbol": symbol, "price": price_usd, "mc": fdv, "name": name}
+        _, _, data = await _get(DEXSCREENER_TOKENS_URL.format(mint))
+        pairs = (data or {}).get("pairs", []) or []
+        if pairs:
+            pair = pairs[0]
+            price_usd = float(pair.get("priceUsd", 0) or 0)
+            fdv = float(pair.get("fdv", 0) or 0)
+            base = (pair.get("baseToken") or {})
+            symbol = base.get("symbol", "TOKEN")
+            name = base.get("name") or symbol or "TOKEN"
+            return {"symbol": symbol, "price": price_usd, "mc": fdv, "name": name}
     except Exception:
         pass
-    return {"symbol": "TOKEN", "price": 0, "mc": 0, "name": "TOKEN"}
+    return None
 
-async def fetch_primary_pair_for_mint(mint: str) -> Optional[dict]:
+_INFO_SOURCES = (_info_pumpfun, _info_dexscreener)  # priority order
+
+INFO_PRIORITY_GRACE_SEC = 1.5  # how long Pump.fun may hold up a DexScreener answer already in hand
+
+async def _fetch_token_info_uncached(mint: str) -> Optional[dict]:
+    """
+    Ask Pump.fun and DexScreener at once, preferring Pump.fun; DexScreener's answer is used as
+    soon as Pump.fun fails, or after a short grace while it is still running. None if both fail.
+    """
+    return await first_by_priority((source(mint) for source in _INFO_SOURCES), INFO_PRIORITY_GRACE_SEC)
+
+PAIR_CACHE_TTL_SEC = 20
+DEXSCREENER_BATCH_MAX = 30  # mints per /tokens/{a,b,...} request
+DEXSCREENER_SINGLE_CONCURRENCY = 5  # parallel one-mint re-lookups for mints a batch left out
+_pair_cache: Dict[str, Tuple[float, Optional[dict]]] = {}  # mint -> (ts, primary pair or None)
+
+# url -> (validator headers, parsed body); lets unchanged lookups come back as an empty 304 (LRU)
+_etag_cache: "OrderedDict[str, Tuple[Dict[str, str], Any]]" = OrderedDict()
+ETAG_CACHE_MAX = 512
+
+async def _get_json_cached(url: str) -> Optional[Any]:
+    """GET url as JSON, revalidating with If-None-Match / If-Modified-Since when we hold a copy."""
+    hit = _etag_cache.get(url)
+    status, headers, data = await _get(url, headers=hit[0] if hit else None)
+    if status == 304 and hit:
+        _etag_cache.move_to_end(url)
+        return hit[1]
+    if status != 200:
+        return None
+    validators = {}
+    if headers.get("ETag"):
+        validators["If-None-Match"] = headers["ETag"]
+    if headers.get("Last-Modified"):
+        validators["If-Modified-Since"] = headers["Last-Modified"]
+    if validators:
+        _etag_cache[url] = (validators, data)
+        _etag_cache.move_to_end(url)
+        while len(_etag_cache) > ETAG_CACHE_MAX:
+            _etag_cache.popitem(last=False)
+    return data
+
+async def _fetch_pairs(mints: List[str]) -> Optional[Dict[str, dict]]:
+    """One /tokens lookup: mint -> primary pair for the mints that came back; None if the request failed."""
     try:
-        async with aiohttp.ClientSession() as session:
-            async with session.get(DEXSCREENER_TOKENS_URL.format(mint)) as resp:
-                if resp.status != 200:
-                    return None
-                data = await resp.json()
-                pairs = data.get("pairs") or []
-                return pairs[0] if pairs else None
+        data = await _get_json_cached(DEXSCREENER_TOKENS_URL.format(",".join(mints)))
     except Exception:
         return None
+    if not data:
+        return None
+    found: Dict[str, dict] = {}
+    for pair in data.get("pairs") or []:
+        base = (pair.get("baseToken") or {}).get("address")
+        if base and base not in found:  # first listed pair is the primary one
+            found[base] = pair
+    return found
+
+async def fetch_primary_pairs(mints: List[str]) -> Dict[str, Optional[dict]]:
+    """
+    mint -> primary DexScreener pair (or None) for every mint.
+    Served from a short TTL cache; misses are fetched 30 mints per request.
+    """
+    now = time.monotonic()
+    out: Dict[str, Optional[dict]] = {}
+    missing = []
+    for mint in dict.fromkeys(mints):
+        hit = _pair_cache.get(mint)
+        if hit and now - hit[0] < PAIR_CACHE_TTL_SEC:
+            out[mint] = hit[1]
+        else:
+            missing.append(mint)
+
+    # DexScreener caps the pairs returned per request, so one mint with many pools can crowd
+    # the others out of a batch; those get asked again on their own before being cached as None
+    alone = []
+    for start in range(0, len(missing), DEXSCREENER_BATCH_MAX):
+        chunk = missing[start:start + DEXSCREENER_BATCH_MAX]
+        found = await _fetch_pairs(chunk)
+        if found is None:
+            continue
+        for mint in chunk:
+            if mint in found or len(chunk) == 1:
+                out[mint] = found.get(mint)
+                _pair_cache[mint] = (now, out[mint])
+            else:
+                alone.append(mint)
+
+    sem = asyncio.Semaphore(DEXSCREENER_SINGLE_CONCURRENCY)
+    async def _one(mint: str):
+        async with sem:
+            return await _fetch_pairs([mint])
+    for mint, found in zip(alone, await asyncio.gather(*(_one(m) for m in alone))):
+        if found is not None:
+            out[mint] = found.get(mint)
+            _pair_cache[mint] = (now, out[mint])
+    return out
+
+async def fetch_primary_pair_for_mint(mint: str) -> Optional[dict]:
+    return (await fetch_primary_pairs([mint])).get(mint)
 
 async def fetch_recent_trades(pair_address: str, limit: int = 25) -> list:
     try:
-        async with aiohttp.ClientSession() as session:
-            async with session.get(DEXSCREENER_TRADES_URL.format(pair_address), params={"limit": str(limit)}) as resp:
-                if resp.status != 200:
-                    return []
-                data = await resp.json()
-                return data.get("trades") or []
+        _, _, data = await _get(DEXSCREENER_TRADES_URL.format(pair_address), params={"limit": str(limit)})
+        return (data or {}).get("trades") or []
     except Exception:
         return []
 
+# ---------------- BACKGROUND TASKS ----------------
+_inflight: Dict[Any, asyncio.Task] = {}  # single_flight registry for this module
+
 # ---------------- REALTIME: HELIUS WS MANAGER ----------------
-def _accounts_in_notif(notif: dict) -> List[str]:
-    accs = set(notif.get("accounts") or [])
-    try:
-        keys = ((notif.get("transaction") or {}).get("message") or {}).get("accountKeys") or []
-        accs.update(keys)
-    except Exception:
-        pass
-    return list(accs)
+def _accounts_in_notif(notif: dict) -> "set[str]":
+    accs = set(notif.get("accounts") or ())
+    keys = ((notif.get("transaction") or {}).get("message") or {}).get("accountKeys") or ()
+    for k in keys:
+        # jsonParsed encoding gives {"pubkey": ..., "signer": ...}; plain json gives strings
+        accs.add(k if isinstance(k, str) else (k or {}).get("pubkey"))
+    return accs
 
 def _delta_for_mint(notif: dict, base_mint: str) -> float:
     """
@@ -279,35 +523,29 @@ def _delta_for_mint(notif: dict, base_mint: str) -> float:
     Positive delta => net base_mint credited => BUY for the token.
     """
     meta = notif.get("meta") or {}
-    pre = meta.get("preTokenBalances") or []
-    post = meta.get("postTokenBalances") or []
-
-    def amt(tb):
-        u = tb.get("uiTokenAmount") or {}
-        return int(u.get("amount", 0) or 0), int(u.get("decimals", 0) or 0)
-
-    pre_map = {}
-    for b in pre:
-        if b.get("mint") == base_mint:
-            a, d = amt(b)
-            pre_map[(b.get("owner"), base_mint)] = (a, d)
-
-    total = 0.0
+    pre_amt = {  # owner -> raw amount before
+        b.get("owner"): int((b.get("uiTokenAmount") or {}).get("amount", 0) or 0)
+        for b in meta.get("preTokenBalances") or ()
+        if b.get("mint") == base_mint
+    }
+    # integer math over raw amounts; one division at the end (decimals are per-mint)
+    raw = 0
     dec = 0
-    for b in post:
+    for b in meta.get("postTokenBalances") or ():
         if b.get("mint") != base_mint:
             continue
-        a_post, dec = amt(b)
-        a_pre, _ = pre_map.get((b.get("owner"), base_mint), (0, dec))
-        total += (a_post - a_pre) / (10 ** max(dec, 0))
-    return total  # positive => buy, negative => sell
+        u = b.get("uiTokenAmount") or {}
+        dec = int(u.get("decimals", 0) or 0)
+        raw += int(u.get("amount", 0) or 0) - pre_amt.get(b.get("owner"), 0)
+    return raw / (10 ** max(dec, 0))  # positive => buy, negative => sell
 
 class HeliusWS:
     """
     Single connection to Helius Enhanced Websocket.
     - Raydium path: subscribe per pair (account include) + optional program filter
     - Pump.fun path: subscribe per mint (account include) + Pump.fun program filter
-    Automatic handoff: if a token has no Raydium pair yet, subscribe via Pump.fun; once pair appears, switch.
+    Automatic handoff: if a token has no Raydium pair yet, subscribe via Pump.fun; the graduation tx arriving on
+    that subscription (or the fallback poll finding a pair) switches it to the Raydium path.
     """
     def __init__(self):
         self.ws: Optional[aiohttp.ClientWebSocketResponse] = None
@@ -319,9 +557,13 @@ class HeliusWS:
         self.r_subs: Dict[str, Dict[str, Any]] = {}
         # pumpfun: mint -> payload
         self.p_subs: Dict[str, Dict[str, Any]] = {}
+        # every key of r_subs and p_subs, so unrelated frames are dropped with one set test
+        self._all_keys: "set[str]" = set()
 
         # last tx dedupe
         self.last_txid: Dict[str, str] = {}
+        # mints with a Raydium pair lookup in flight
+        self._promoting: "set[str]" = set()
 
         # reconnect backoff
         self._reconnect_delay = 2
@@ -337,18 +579,18 @@ class HeliusWS:
     async def _connect(self):
         if self.session is None or self.session.closed:
             self.session = aiohttp.ClientSession()
-        logging.info("Connecting to Helius WS...")
+        logging.debug("Connecting to Helius WS...")
         self.ws = await self.session.ws_connect(HELIUS_WS_URL, heartbeat=20)
         self.ready.set()
         self._reconnect_delay = 2
         await self._resubscribe_all()
-        asyncio.create_task(self._receiver_loop())
+        spawn(self._receiver_loop())
 
     async def _receiver_loop(self):
         try:
             async for msg in self.ws:
-                if msg.type == aiohttp.WSMsgType.TEXT:
-                    await self._handle_message(json.loads(msg.data))
+                if msg.type in (aiohttp.WSMsgType.TEXT, aiohttp.WSMsgType.BINARY):
+                    await self._handle_message(orjson.loads(msg.data))
                 elif msg.type == aiohttp.WSMsgType.ERROR:
                     break
         except Exception as e:
@@ -370,29 +612,28 @@ class HeliusWS:
             await self._connect()
         except Exception as e:
             logging.error(f"Reconnect failed: {e}")
-            asyncio.create_task(self._schedule_reconnect())
+            spawn(self._schedule_reconnect())
 
     def _next_id(self) -> int:
         self._id += 1
         return self._id
 
-    async def _send(self, payload: dict):
+    async def _send(self, payload):
+        """payload is one JSON-RPC request, or a list of them sent as a single batch frame."""
         if not self.ws or self.ws.closed:
             return
-        await self.ws.send_str(json.dumps(payload))
+        # serialized by orjson in one call; kept as a TEXT frame since not every Solana pubsub server reads BINARY
+        await self.ws.send_str(orjson.dumps(payload).decode())
 
     async def _resubscribe_all(self):
-        # Raydium pairs
-        for pair_addr in list(self.r_subs.keys()):
-            await self.subscribe_raydium_pair(pair_addr)
-        # Pump.fun mints
-        for mint in list(self.p_subs.keys()):
-            await self.subscribe_pumpfun_mint(mint)
+        # one JSON-RPC batch frame for every Raydium pair and Pump.fun mint
+        batch = [self._raydium_payload(pair_addr) for pair_addr in list(self.r_subs.keys())]
+        batch += [self._pumpfun_payload(mint) for mint in list(self.p_subs.keys())]
+        if batch and HELIUS_WS_URL:
+            await self._send(batch)
 
     # ----- Subscribe builders -----
-    async def subscribe_raydium_pair(self, pair_addr: str):
-        if not HELIUS_WS_URL:
-            return
+    def _raydium_payload(self, pair_addr: str) -> dict:
         params = {
             "commitment": "confirmed",
             "encoding": "jsonParsed",
@@ -409,17 +650,14 @@ class HeliusWS:
         if program_ids:
             params["programIds"] = program_ids
 
-        payload = {
+        return {
             "jsonrpc": "2.0",
             "id": self._next_id(),
             "method": "transactionSubscribe",
             "params": [params],
         }
-        await self._send(payload)
 
-    async def subscribe_pumpfun_mint(self, mint: str):
-        if not HELIUS_WS_URL:
-            return
+    def _pumpfun_payload(self, mint: str) -> dict:
         params = {
             "commitment": "confirmed",
             "encoding": "jsonParsed",
@@ -429,16 +667,31 @@ class HeliusWS:
         if USE_PUMPFUN_FILTER and PUMPFUN_PROGRAM_IDS:
             params["programIds"] = PUMPFUN_PROGRAM_IDS
 
-        payload = {
+        return {
             "jsonrpc": "2.0",
             "id": self._next_id(),
             "method": "transactionSubscribe",
             "params": [params],
         }
-        await self._send(payload)
+
+    async def subscribe_raydium_pair(self, pair_addr: str):
+        if not HELIUS_WS_URL:
+            return
+        await self._send(self._raydium_payload(pair_addr))
+
+    async def subscribe_pumpfun_mint(self, mint: str):
+        if not HELIUS_WS_URL:
+            return
+        await self._send(self._pumpfun_payload(mint))
 
     # ----- Incoming notifications -----
-    async def _handle_message(self, data: dict):
+    async def _handle_message(self, data):
+        if isinstance(data, list):
+            # batch response (acks for a batched resubscribe)
+            for item in data:
+                if isinstance(item, dict):
+                    await self._handle_message(item)
+            return
         if "result" in data and "id" in data and "method" not in data:
             # subscribe ack, ignore
             return
@@ -448,16 +701,25 @@ class HeliusWS:
 
         notif = (data.get("params") or {}).get("result") or {}
         accs = _accounts_in_notif(notif)
+        hits = accs & self._all_keys
+        if not hits:
+            return
 
-        # Raydium (by pair)
-        for pair_addr, sub in list(self.r_subs.items()):
-            if pair_addr in accs:
-                await self._handle_swap_raydium(pair_addr, sub, notif)
+        # Raydium (by pair) / Pump.fun (by mint): hash lookups, not a scan over every sub
+        for key in hits:
+            sub = self.r_subs.get(key)
+            if sub:
+                await self._handle_swap_raydium(key, sub, notif)
 
-        # Pump.fun (by mint)
-        for mint, sub in list(self.p_subs.items()):
-            if mint in accs:
-                await self._handle_buy_pumpfun(mint, sub, notif)
+        for mint in hits:
+            sub = self.p_subs.get(mint)
+            if not sub:
+                continue
+            if not accs.isdisjoint(_RAYDIUM_PROGRAMS):
+                # maybe the graduation tx; aggregator buys routed via Raydium touch it too, so still
+                # handle it as a buy (a migration nets out to a delta <= 0 and is skipped there)
+                self._schedule_promotion(mint)
+            await self._handle_buy_pumpfun(mint, sub, notif)
 
     # ----- Decoders / handlers -----
     async def _handle_swap_raydium(self, pair_addr: str, sub: Dict[str, Any], notif: dict):
@@ -506,13 +768,13 @@ class HeliusWS:
 
         # If still no USD, estimate with cached price
         if usd is None:
-            px = float(sub.get("price_usd") or 0)
+            px = sub.get("price_usd_f", 0.0)
             if px and amount_token is not None:
                 usd = amount_token * px
 
         if usd is None:
             return
-        if usd < float(sub.get("min_buy_usd") or DEFAULT_MIN_BUY_USD):
+        if usd < sub["min_buy_usd_f"]:
             return
 
         await self._send_alert(pair_addr, sub, txid, usd, amount_token)
@@ -533,20 +795,20 @@ class HeliusWS:
         amount_token = delta
 
         # Price (pre-listing): try Pump.fun API; cache
-        px = float(sub.get("price_usd") or 0)
+        px = sub.get("price_usd_f", 0.0)
         if not px:
             info = await fetch_token_info(mint)
             try:
                 px = float(info.get("price") or 0)
                 if px:
-                    sub["price_usd"] = px
+                    sub["price_usd_f"] = px
             except Exception:
                 px = 0.0
 
         usd = amount_token * px if px else None
         if usd is None:
             return
-        if usd < float(sub.get("min_buy_usd") or DEFAULT_MIN_BUY_USD):
+        if usd < sub["min_buy_usd_f"]:
             return
 
         await self._send_alert("pumpfun", sub, txid, usd, amount_token)
@@ -557,58 +819,17 @@ class HeliusWS:
         symbol = sub.get("symbol") or "TOKEN"
         emoji = sub.get("emoji") or DEFAULT_EMOJI
         media = sub.get("media_file_id")
-        mcap = float(sub.get("mcap") or 0)
+        mcap = sub.get("mcap_f", 0.0)
 
         token_str = fmt_amount(amount_token) if amount_token is not None else "—"
-        tx_url = f"https://solscan.io/tx/{txid}"
-        if key == "pumpfun":
-            dexs = f"https://dexscreener.com/solana/{mint}"  # may be empty pre-listing
-        else:
-            dexs = f"https://dexscreener.com/solana/{key}"
-        jup = f"https://jup.ag/swap/SOL-{mint}"
+        tx_url = SOLSCAN_TX_URL + txid
 
-        socials_txt = ""
-        try:
-            soc = json.loads(sub.get("socials_json") or "{}")
-            parts = []
-            if soc.get("x"): parts.append(f"[X]({soc['x']})")
-            if soc.get("instagram"): parts.append(f"[IG]({soc['instagram']})")
-            if soc.get("website"): parts.append(f"[Web]({soc['website']})")
-            if parts:
-                socials_txt = " " + " • ".join(parts)
-        except Exception:
-            pass
-
-        title = f"{emoji} | {symbol} BUY!"
-        body = (
-            f"🔷 ~USD {fmt_usd(usd)}\n"
-            f"🪙 {symbol} {token_str}\n"
-            f"🔎 Position: New Holder [Unknown]({tx_url})\n"
-            f"📈 MCap: {fmt_usd(mcap)}{socials_txt}\n"
-            f"[Tx]({tx_url})"
-        )
-        text = f"{title}\n{body}"
+        text = _render_alert(emoji, symbol, usd, token_str, tx_url, mcap, sub.get("socials_txt", ""))
 
-        buttons = [
-            [InlineKeyboardButton("📊 Dex", url=dexs), InlineKeyboardButton("💲 Buy", url=jup)],
-            [InlineKeyboardButton("Txn", url=tx_url)],
-        ]
-        markup = InlineKeyboardMarkup(buttons)
+        markup = _alert_markup(sub["dexs_url"], sub["jup_url"], tx_url)
 
         try:
-            if media:
-                await ws_context.bot.send_photo(
-                    chat_id,
-                    photo=media,
-                    caption=text,
-                    reply_markup=markup,
-                    parse_mode="Markdown",
-                    disable_web_page_preview=True,
-                )
-            else:
-                await ws_context.bot.send_message(
-                    chat_id, text, reply_markup=markup, parse_mode="Markdown", disable_web_page_preview=True
-                )
+            await _send_buy_alert(ws_context.bot, chat_id, media, text, markup)
         except Exception as e:
             logging.error(f"Send alert failed: {e}")
 
@@ -617,9 +838,14 @@ class HeliusWS:
         """
         sub_payload: {chat_id, mint, symbol, emoji, min_buy_usd, socials_json, media_file_id}
         - If Raydium pair exists => subscribe on Raydium (pair).
-        - Else => subscribe on Pump.fun (by mint) and start a handoff task that watches for Raydium listing.
+        - Else => subscribe on Pump.fun (by mint); it is promoted to Raydium once it graduates.
         """
         mint = sub_payload["mint"]
+        # socials and link targets are built once here rather than on every alert
+        sub_payload["socials_txt"] = _render_socials(_parse_socials(sub_payload.get("socials_json")))
+        sub_payload["min_buy_usd_f"] = float(sub_payload.get("min_buy_usd") or DEFAULT_MIN_BUY_USD)
+        sub_payload["dexs_url"] = DEXSCREENER_PAGE_URL + mint  # may be empty pre-listing
+        sub_payload["jup_url"] = JUP_SWAP_URL + mint
 
         # If we were already Pump.fun-subscribing for this mint, keep payload updated
         if mint in self.p_subs:
@@ -633,187 +859,210 @@ class HeliusWS:
                 try:
                     base = pair.get("baseToken") or {}
                     sub_payload["symbol"] = (sub_payload.get("symbol") or base.get("symbol") or "TOKEN")
-                    sub_payload["price_usd"] = float(pair.get("priceUsd", 0) or 0)
-                    sub_payload["mcap"] = float(pair.get("fdv", 0) or 0)
+                    sub_payload["price_usd_f"] = float(pair.get("priceUsd", 0) or 0)
+                    sub_payload["mcap_f"] = float(pair.get("fdv", 0) or 0)
                 except Exception:
                     pass
 
                 # register Raydium sub
+                sub_payload["dexs_url"] = DEXSCREENER_PAGE_URL + pair_addr
                 self.r_subs[pair_addr] = sub_payload
+                self._all_keys.add(pair_addr)
                 await self.ensure_connected()
                 await self.subscribe_raydium_pair(pair_addr)
 
                 # If we were on Pump.fun for this mint, drop it
                 if mint in self.p_subs:
                     del self.p_subs[mint]
+                    self._all_keys.discard(mint)
                 return
 
         # No Raydium yet — register Pump.fun subscription by mint
         self.p_subs[mint] = sub_payload
+        self._all_keys.add(mint)
         await self.ensure_connected()
         await self.subscribe_pumpfun_mint(mint)
 
-        # Start/refresh a handoff watcher for this mint
-        asyncio.create_task(self._handoff_to_raydium_when_listed(mint))
+    def _schedule_promotion(self, mint: str):
+        if mint not in self._promoting:
+            self._promoting.add(mint)
+            spawn(self._promote_when_listed(mint))
 
-    async def _handoff_to_raydium_when_listed(self, mint: str):
-        # Periodically check if a Raydium pair appears; then add raydium sub and drop pumpfun sub.
-        for _ in range(60):  # ~10 min if sleep 10s
-            await asyncio.sleep(10)
-            if mint not in self.p_subs:
-                return  # already switched
-            pair = await fetch_primary_pair_for_mint(mint)
-            if not pair:
-                continue
-            pair_addr = pair.get("pairAddress")
-            if not pair_addr:
-                continue
+    async def _promote_when_listed(self, mint: str):
+        # One short burst of lookups after the graduation tx, instead of a standing poll per mint
+        try:
+            for delay in PROMOTE_RETRY_DELAYS:
+                await asyncio.sleep(delay)
+                if mint not in self.p_subs:
+                    return  # already switched (e.g. by the fallback poll)
+                pair = await fetch_primary_pair_for_mint(mint)
+                if pair and await self.promote_to_raydium(mint, pair):
+                    return
+        finally:
+            self._promoting.discard(mint)
+
+    async def promote_to_raydium(self, mint: str, pair: dict) -> bool:
+        """Move a Pump.fun-tracked mint onto its Raydium pair. Returns True if it switched."""
+        sub_payload = self.p_subs.get(mint)
+        pair_addr = pair.get("pairAddress")
+        if not sub_payload or not pair_addr:
+            return False
+        # cache price/meta
+        try:
+            base = pair.get("baseToken") or {}
+            sub_payload["symbol"] = (sub_payload.get("symbol") or base.get("symbol") or "TOKEN")
+            sub_payload["price_usd_f"] = float(pair.get("priceUsd", 0) or 0)
+            sub_payload["mcap_f"] = float(pair.get("fdv", 0) or 0)
+        except Exception:
+            pass
 
-            sub_payload = self.p_subs.get(mint)
-            if not sub_payload:
-                return
-            # cache price/meta
-            try:
-                base = pair.get("baseToken") or {}
-                sub_payload["symbol"] = (sub_payload.get("symbol") or base.get("symbol") or "TOKEN")
-                sub_payload["price_usd"] = float(pair.get("priceUsd", 0) or 0)
-                sub_payload["mcap"] = float(pair.get("fdv", 0) or 0)
-            except Exception:
-                pass
-
-            self.r_subs[pair_addr] = sub_payload
-            await self.subscribe_raydium_pair(pair_addr)
-            # remove pumpfun sub
-            if mint in self.p_subs:
-                del self.p_subs[mint]
-            logging.info(f"Switched {short_mint(mint)} to Raydium pair {pair_addr}")
-            return
+        sub_payload["dexs_url"] = DEXSCREENER_PAGE_URL + pair_addr
+        self.r_subs[pair_addr] = sub_payload
+        del self.p_subs[mint]
+        self._all_keys.add(pair_addr)
+        self._all_keys.discard(mint)
+        await self.subscribe_raydium_pair(pair_addr)
+        logging.info(f"Switched {short_mint(mint)} to Raydium pair {pair_addr}")
+        return True
 
 # Global WS manager instance and a lightweight context handle for bot send access
 ws_manager = HeliusWS()
 ws_context: ContextTypes.DEFAULT_TYPE  # set at runtime in starter job
 
 # ---------------- POLLING FAILSAFE (DexScreener) ----------------
-fallback_last_seen: Dict[str, str] = {}  # pairAddress -> last trade txId
+FALLBACK_CONCURRENCY = 25  # rows polled/sent at once; bot.py's AIORateLimiter paces the actual sends
 
-async def fallback_poll(context: ContextTypes.DEFAULT_TYPE):
-    conn = sqlite3.connect(DB_PATH)
-    c = conn.cursor()
-    c.execute("""
-        SELECT chat_id, mint, media_file_id, symbol, emoji, min_buy_usd, socials_json, active
-        FROM tracked_tokens WHERE active=1
-    """)
-    rows = c.fetchall()
-    conn.close()
-
-    for chat_id, mint, media_file_id, symbol, emoji, min_buy_usd, socials_json, active in rows:
+async def _send_buy_alert(bot, chat_id: int, media: Optional[str], text: str, markup: InlineKeyboardMarkup):
+    if media:
+        await bot.send_photo(
+            chat_id, photo=media, caption=text, reply_markup=markup,
+            parse_mode="Markdown", disable_web_page_preview=True
+        )
+    else:
+        await bot.send_message(
+            chat_id, text, reply_markup=markup, parse_mode="Markdown", disable_web_page_preview=True
+        )
+
+async def _fallback_row(
+    context: ContextTypes.DEFAULT_TYPE, row: tuple, pair: Optional[dict], sem: asyncio.Semaphore
+) -> Optional[tuple]:
+    """Alert new buys for one tracked row; returns its updated cursor (pair_addr, txid, chat_id, mint) if it moved."""
+    chat_id, mint, media_file_id, symbol, emoji, min_buy_usd, socials_json, active, seen_pair, seen_txid = row
+    async with sem:
         try:
-            pair = await fetch_primary_pair_for_mint(mint)
             if not pair:
-                continue
+                return
             pair_addr = pair.get("pairAddress")
             if not pair_addr:
-                continue
+                return
 
             trades = await fetch_recent_trades(pair_addr, limit=25)
             if not trades:
-                continue
+                return
+
+            newest = trades[0].get("txId")
+            if not newest or (pair_addr == seen_pair and newest == seen_txid):
+                return None
+            cursor = (pair_addr, newest, chat_id, mint)
+            if pair_addr != seen_pair or not seen_txid:
+                return cursor  # first look at this pair: start from its newest trade, don't replay history
+            last_txid = seen_txid
 
-            last_txid = fallback_last_seen.get(pair_addr)
-            new_trades = []
-            for t in trades:  # newest-first
+            # one newest-first pass: stop at the last seen tx, keep only buys over threshold
+            threshold = float(min_buy_usd or DEFAULT_MIN_BUY_USD)
+            new_buys = []
+            for t in trades:
                 txid = t.get("txId")
                 if not txid:
                     continue
                 if txid == last_txid:
                     break
-                new_trades.append(t)
-            new_trades.reverse()
-
-            if trades:
-                fallback_last_seen[pair_addr] = trades[0].get("txId") or last_txid
-
-            threshold = float(min_buy_usd or DEFAULT_MIN_BUY_USD)
-            chosen_emoji = (emoji or DEFAULT_EMOJI)
-            dexs = f"https://dexscreener.com/solana/{pair_addr}"
-            jup = f"https://jup.ag/swap/SOL-{mint}"
-
-            socials_txt = ""
-            try:
-                soc = json.loads(socials_json) if socials_json else {}
-                parts = []
-                if soc.get("x"): parts.append(f"[X]({soc['x']})")
-                if soc.get("instagram"): parts.append(f"[IG]({soc['instagram']})")
-                if soc.get("website"): parts.append(f"[Web]({soc['website']})")
-                if parts:
-                    socials_txt = " " + " • ".join(parts)
-            except Exception:
-                pass
-
-            for t in new_trades:
                 if (t.get("side") or "").lower() != "buy":
                     continue
                 usd = float(t.get("amountUsd", 0) or 0)
-                if usd < threshold:
-                    continue
+                if usd >= threshold:
+                    new_buys.append((t, usd))
+            if not new_buys:
+                return cursor
+            new_buys.reverse()
+
+            chosen_emoji = (emoji or DEFAULT_EMOJI)
+            dexs = DEXSCREENER_PAGE_URL + pair_addr
+            jup = JUP_SWAP_URL + mint
+
+            socials_txt = _render_socials(_parse_socials(socials_json))
+            mcap = float(pair.get("fdv", 0) or 0)
+            psymbol = (symbol or (pair.get("baseToken") or {}).get("symbol") or "TOKEN")
 
-                token_amount = t.get("amountToken")
+            # sends within a row stay sequential so a chat sees its buys in order
+            for t, usd in new_buys:
+                token_amount = float(t.get("amountToken") or 0) or None
                 txid = t.get("txId")
-                tx_url = f"https://solscan.io/tx/{txid}"
+                tx_url = SOLSCAN_TX_URL + txid
                 px = float(t.get("priceUsd", 0) or pair.get("priceUsd", 0) or 0)
-                mcap = float(pair.get("fdv", 0) or 0)
-                psymbol = (symbol or (pair.get("baseToken") or {}).get("symbol") or "TOKEN")
 
                 if not token_amount and px:
                     token_amount = usd / px
                 token_str = fmt_amount(token_amount) if token_amount is not None else "—"
 
-                title = f"{chosen_emoji} | {psymbol} BUY!"
-                body = (
-                    f"🔷 ~USD {fmt_usd(usd)}\n"
-                    f"🪙 {psymbol} {token_str}\n"
-                    f"🔎 Position: New Holder [Unknown]({tx_url})\n"
-                    f"📈 MCap: {fmt_usd(mcap)}{socials_txt}\n"
-                    f"[Tx]({tx_url})"
-                )
-                text = f"{title}\n{body}"
+                text = _render_alert(chosen_emoji, psymbol, usd, token_str, tx_url, mcap, socials_txt)
 
-                buttons = [
-                    [InlineKeyboardButton("📊 Dex", url=dexs), InlineKeyboardButton("💲 Buy", url=jup)],
-                    [InlineKeyboardButton("Txn", url=tx_url)],
-                ]
-                markup = InlineKeyboardMarkup(buttons)
+                markup = _alert_markup(dexs, jup, tx_url)
 
                 try:
-                    if media_file_id:
-                        await context.bot.send_photo(
-                            chat_id, photo=media_file_id, caption=text, reply_markup=markup,
-                            parse_mode="Markdown", disable_web_page_preview=True
-                        )
-                    else:
-                        await context.bot.send_message(
-                            chat_id, text, reply_markup=markup, parse_mode="Markdown", disable_web_page_preview=True
-                        )
+                    await _send_buy_alert(context.bot, chat_id, media_file_id, text, markup)
                 except Exception as e:
                     logging.error(f"Fallback send failed: {e}")
+            return cursor
 
         except Exception as e:
             logging.error(f"Fallback poll error for {mint}: {e}")
+            return None
+
+async def fallback_poll(context: ContextTypes.DEFAULT_TYPE):
+    rows = await asyncio.to_thread(_load_active_rows)
+    pairs = await fetch_primary_pairs([row[1] for row in rows])
+
+    # the batched lookup doubles as a graduation check for mints still on the Pump.fun path
+    for mint in pairs.keys() & ws_manager.p_subs.keys():
+        if pairs[mint]:
+            await ws_manager.promote_to_raydium(mint, pairs[mint])
+
+    sem = asyncio.Semaphore(FALLBACK_CONCURRENCY)
+    results = await asyncio.gather(
+        *(_fallback_row(context, row, pairs.get(row[1]), sem) for row in rows),
+        return_exceptions=True,
+    )
+    cursors = [r for r in results if isinstance(r, tuple)]
+    if cursors:
+        try:
+            await asyncio.to_thread(save_fallback_cursors, cursors)
+        except Exception as e:
+            logging.error(f"Fallback cursor save failed: {e}")
 
 # ---------------- DM FLOW STATE ----------------
-PENDING_DM: Dict[int, Dict] = {}
-
-def _settings_keyboard() -> InlineKeyboardMarkup:
-    rows = [
-        [InlineKeyboardButton("😀 Emoji", callback_data="bt:set:emoji")],
-        [InlineKeyboardButton("📦 Total Supply", callback_data="bt:set:supply")],
-        [InlineKeyboardButton("💵 Min Buy ($)", callback_data="bt:set:minbuy")],
-        [InlineKeyboardButton("🖼️ Media", callback_data="bt:set:media")],
-        [InlineKeyboardButton("🔗 Socials", callback_data="bt:set:socials")],
-        [InlineKeyboardButton("🗑 Delete Token", callback_data="bt:set:delete")],
-        [InlineKeyboardButton("✅ Done / Activate", callback_data="bt:set:done")],
-    ]
-    return InlineKeyboardMarkup(rows)
+# user_id -> wizard state; abandoned flows expire after PENDING_DM_TTL_SEC idle (and the map is capped)
+PENDING_DM_TTL_SEC = 900
+PENDING_DM: TTLCache = TTLCache(maxsize=10_000, ttl=PENDING_DM_TTL_SEC)
+
+def _dm_state(uid: int) -> Optional[Dict]:
+    state = PENDING_DM.get(uid)
+    if state is not None:
+        PENDING_DM[uid] = state  # re-insert to restart the idle timer
+    return state
+
+# Telegram objects are immutable, so the settings menu is built once and shared
+_SETTINGS_MARKUP = InlineKeyboardMarkup([
+    [InlineKeyboardButton("😀 Emoji", callback_data="bt:set:emoji")],
+    [InlineKeyboardButton("📦 Total Supply", callback_data="bt:set:supply")],
+    [InlineKeyboardButton("💵 Min Buy ($)", callback_data="bt:set:minbuy")],
+    [InlineKeyboardButton("🖼️ Media", callback_data="bt:set:media")],
+    [InlineKeyboardButton("🔗 Socials", callback_data="bt:set:socials")],
+    [InlineKeyboardButton("🗑 Delete Token", callback_data="bt:set:delete")],
+    [InlineKeyboardButton("✅ Done / Activate", callback_data="bt:set:done")],
+])
+
+_SEND_ANOTHER_MINT_BTN = InlineKeyboardButton("↩️ Send another mint", callback_data="bt:again")
 
 # ---------------- COMMANDS (GROUP → PAIRING CODE) ----------------
 async def cmd_track_group(update: Update, context: ContextTypes.DEFAULT_TYPE):
@@ -823,7 +1072,6 @@ async def cmd_track_group(update: Update, context: ContextTypes.DEFAULT_TYPE):
         await update.message.reply_text("Use /track inside a group to configure via DM.")
         return
 
-    me = await context.bot.get_me()
     code = _gen_pair_code()
     _put_code(code, origin_chat_id=chat.id, user_id=user.id)
 
@@ -835,7 +1083,8 @@ async def cmd_track_group(update: Update, context: ContextTypes.DEFAULT_TYPE):
         "code": code,
     }
 
-    dm_url = f"https://t.me/{me.username}"
+    # Application.initialize() already fetched getMe; bot.username reads that cached User
+    dm_url = f"https://t.me/{context.bot.username}"
     kb = InlineKeyboardMarkup([[InlineKeyboardButton("💬 Open DM with SentriBot", url=dm_url)]])
     await update.message.reply_text(
         "I’ll guide you in DM to set this up for this group.\n\n"
@@ -848,8 +1097,16 @@ async def cmd_track_group(update: Update, context: ContextTypes.DEFAULT_TYPE):
     )
 
 # ---------------- DM GATE (HIGH PRIORITY) ----------------
-PAIR_RX = re.compile(r"^\s*track\s+(\d{6})\s*$", re.IGNORECASE)
+def _track_code(text: str) -> Optional[str]:
+    """The code from a "track 123456" message, else None (plain str ops, runs on every DM)."""
+    parts = text.split(None, 1)
+    if len(parts) == 2 and len(parts[1]) == 6 and parts[1].isdigit() and parts[0].lower() == "track":
+        return parts[1]
+    return None
+
 ANY_CODE_RX = re.compile(r"\b(\d{6})\b")
+_CMD_PREFIX_RX = re.compile(r"^\s*/")   # "/cmd" typed while a DM flow expects plain text
+_MINT_RX = re.compile(r"^[1-9A-HJ-NP-Za-km-z]{32,44}$")  # base58 pubkey
 
 async def buy_dm_gate(update: Update, context: ContextTypes.DEFAULT_TYPE):
     chat = update.effective_chat
@@ -858,18 +1115,30 @@ async def buy_dm_gate(update: Update, context: ContextTypes.DEFAULT_TYPE):
         return
 
     uid = update.effective_user.id
-    state = PENDING_DM.get(uid)
+    text = (msg.text or msg.caption).strip()
+
+    # "track <code>" from the group (re)starts the flow whatever state the user is in
+    code = _track_code(text) if msg.text else None
+    if code:
+        origin_chat_id = _pop_valid_code(code, uid)
+        if not origin_chat_id:
+            await msg.reply_text("❌ Invalid or expired code. Go back to your group and run /track again.")
+            raise ApplicationHandlerStop
+        PENDING_DM[uid] = {"stage": "ask_mint", "origin_chat_id": origin_chat_id, "mint": None, "tmp": {}}
+        await msg.reply_text("🧭 Send the <b>mint address</b> you want to track.", parse_mode="HTML")
+        raise ApplicationHandlerStop
+
+    state = _dm_state(uid)
     if not state:
         return
 
     entities = (msg.entities or []) + (msg.caption_entities or [])
-    if any(getattr(e, "type", "") == "bot_command" for e in entities) or (msg.text and msg.text.strip().startswith("/")):
+    if any(getattr(e, "type", "") == "bot_command" for e in entities) or (msg.text and _CMD_PREFIX_RX.match(msg.text)):
         await msg.reply_text("Please send the text only (no /commands).")
         raise ApplicationHandlerStop
 
     if state.get("stage") == "await_code":
-        text = (msg.text or msg.caption or "").strip()
-        m = PAIR_RX.match(text) or ANY_CODE_RX.search(text)
+        m = ANY_CODE_RX.search(text)
         if not m:
             await msg.reply_text(
                 "Please send the pairing code I gave you in the group (e.g., <code>track 123456</code> or just <code>123456</code>).",
@@ -888,27 +1157,6 @@ async def buy_dm_gate(update: Update, context: ContextTypes.DEFAULT_TYPE):
     await dm_text_router(update, context)
     raise ApplicationHandlerStop
 
-# ---------------- DM ENTRY via "track <code)" ----------------
-async def dm_entry_by_code(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    chat = update.effective_chat
-    msg = update.message
-    if chat.type != "private" or not msg or not msg.text:
-        return
-
-    m = PAIR_RX.match(msg.text)
-    if not m:
-        return
-
-    uid = update.effective_user.id
-    code = m.group(1)
-    origin_chat_id = _pop_valid_code(code, uid)
-    if not origin_chat_id:
-        await msg.reply_text("❌ Invalid or expired code. Go back to your group and run /track again.")
-        return
-
-    PENDING_DM[uid] = {"stage": "ask_mint", "origin_chat_id": origin_chat_id, "mint": None, "tmp": {}}
-    await msg.reply_text("🧭 Send the <b>mint address</b> you want to track.", parse_mode="HTML")
-
 # ---------------- DM TEXT HANDLER ----------------
 async def dm_text_router(update: Update, context: ContextTypes.DEFAULT_TYPE):
     chat = update.effective_chat
@@ -917,22 +1165,26 @@ async def dm_text_router(update: Update, context: ContextTypes.DEFAULT_TYPE):
         return
 
     uid = update.effective_user.id
-    state = PENDING_DM.get(uid)
+    state = _dm_state(uid)
     if not state:
         return
 
     stage = state.get("stage")
     origin = state.get("origin_chat_id")
 
-    if msg.text.strip().startswith("/"):
+    if _CMD_PREFIX_RX.match(msg.text):
         await msg.reply_text("Please send text (no /commands) while configuring.")
         return
+    text = msg.text.strip()
 
     if stage == "ask_mint":
-        mint = msg.text.strip()
+        mint = text
         if is_native_sol(mint):
             await msg.reply_text("⚠️ Native SOL isn’t an SPL mint. Send a token mint address.")
             return
+        if not _MINT_RX.match(mint):
+            await msg.reply_text("That doesn’t look like a mint address. Send the token’s base58 mint address.")
+            return
         try:
             info = await fetch_token_info(mint)
         except Exception:
@@ -940,11 +1192,14 @@ async def dm_text_router(update: Update, context: ContextTypes.DEFAULT_TYPE):
         symbol = (info.get("symbol") or "TOKEN")
         name = (info.get("name") or symbol)
         state["mint"] = mint
-        upsert_token(origin, mint, symbol=symbol, min_buy_usd=DEFAULT_MIN_BUY_USD)
+        state["symbol"] = symbol  # reused for the activation message at "done"
+        state["name"] = name
+        state["tmp"] = {}  # settings edits are buffered here and written once at "done"
+        await asyncio.to_thread(upsert_token, origin, mint, symbol=symbol, min_buy_usd=DEFAULT_MIN_BUY_USD)
         kb = InlineKeyboardMarkup(
             [
                 [InlineKeyboardButton(f"✅ {name} ({symbol}) — {short_mint(mint)}", callback_data=f"bt:confirm:{mint}")],
-                [InlineKeyboardButton("↩️ Send another mint", callback_data="bt:again")],
+                [_SEND_ANOTHER_MINT_BTN],
             ]
         )
         await msg.reply_text(
@@ -956,55 +1211,54 @@ async def dm_text_router(update: Update, context: ContextTypes.DEFAULT_TYPE):
         return
 
     if stage == "set_emoji":
-        emoji = msg.text.strip()
-        upsert_token(origin, state["mint"], emoji=emoji)
-        await msg.reply_text(f"Emoji set to {emoji}")
+        emoji = text
+        state["tmp"]["emoji"] = emoji
         state["stage"] = "settings"
-        await msg.reply_text("🛠 Buy Bot Settings:", reply_markup=_settings_keyboard())
+        await msg.reply_text(f"Emoji set to {emoji}\n\n🛠 Buy Bot Settings:", reply_markup=_SETTINGS_MARKUP)
         return
 
     if stage == "set_supply":
         try:
-            supply = float(msg.text.strip().replace(",", ""))
-            upsert_token(origin, state["mint"], total_supply=supply)
-            await msg.reply_text(f"Total supply set to {supply:,.0f}")
-        except Exception:
+            supply = float(text.replace(",", ""))
+        except ValueError:
             await msg.reply_text("Please send a number (e.g., 1_000_000_000).")
             return
+        state["tmp"]["total_supply"] = supply
         state["stage"] = "settings"
-        await msg.reply_text("🛠 Buy Bot Settings:", reply_markup=_settings_keyboard())
+        await msg.reply_text(f"Total supply set to {supply:,.0f}\n\n🛠 Buy Bot Settings:", reply_markup=_SETTINGS_MARKUP)
         return
 
     if stage == "set_minbuy":
         try:
-            mb = float(msg.text.strip().replace("$", "").replace(",", ""))
-            upsert_token(origin, state["mint"], min_buy_usd=mb)
-            await msg.reply_text(f"Min buy set to ${mb:,.2f}")
-        except Exception:
+            mb = float(text.replace("$", "").replace(",", ""))
+        except ValueError:
             await msg.reply_text("Send a dollar amount (e.g., 5 or 12.5).")
             return
+        state["tmp"]["min_buy_usd"] = mb
         state["stage"] = "settings"
-        await msg.reply_text("🛠 Buy Bot Settings:", reply_markup=_settings_keyboard())
+        await msg.reply_text(f"Min buy set to ${mb:,.2f}\n\n🛠 Buy Bot Settings:", reply_markup=_SETTINGS_MARKUP)
         return
 
     if stage == "set_socials":
-        text = msg.text.strip()
-        data = {}
-        try:
-            if text.startswith("{"):
+        if text.startswith("{") and text.endswith("}"):
+            try:
                 data = json.loads(text)
-            else:
-                for part in text.splitlines():
-                    if ":" in part:
-                        k, v = part.split(":", 1)
-                        data[k.strip().lower()] = v.strip()
-        except Exception:
-            await msg.reply_text("Send socials as key:value lines or a small JSON object.")
-            return
-        upsert_token(origin, state["mint"], socials_json=json.dumps(data))
-        await msg.reply_text("Socials updated.")
+            except ValueError:
+                data = None
+            if not isinstance(data, dict):
+                await msg.reply_text("Send socials as key:value lines or a small JSON object.")
+                return
+        else:
+            # key:value per line; "x:https://..." splits on the first colon only
+            data = {}
+            for part in text.splitlines():
+                k, sep, v = part.partition(":")
+                k = k.strip().lower()
+                if sep and k:
+                    data[k] = v.strip()
+        state["tmp"]["socials_json"] = json.dumps(data)
         state["stage"] = "settings"
-        await msg.reply_text("🛠 Buy Bot Settings:", reply_markup=_settings_keyboard())
+        await msg.reply_text("Socials updated.\n\n🛠 Buy Bot Settings:", reply_markup=_SETTINGS_MARKUP)
         return
 
 # ---------------- DM MEDIA HANDLER ----------------
@@ -1014,13 +1268,10 @@ async def dm_media_router(update: Update, context: ContextTypes.DEFAULT_TYPE):
     if chat.type != "private" or not msg:
         return
     uid = update.effective_user.id
-    state = PENDING_DM.get(uid)
+    state = _dm_state(uid)
     if not state or state.get("stage") != "set_media":
         return
 
-    origin = state["origin_chat_id"]
-    mint = state["mint"]
-
     file_id = None
     if msg.photo:
         file_id = msg.photo[-1].file_id
@@ -1033,65 +1284,56 @@ async def dm_media_router(update: Update, context: ContextTypes.DEFAULT_TYPE):
         await msg.reply_text("Please send an image or video.")
         return
 
-    upsert_token(origin, mint, media_file_id=file_id)
-    await msg.reply_text("Media saved.")
+    state["tmp"]["media_file_id"] = file_id
     state["stage"] = "settings"
-    await msg.reply_text("🛠 Buy Bot Settings:", reply_markup=_settings_keyboard())
+    await msg.reply_text("Media saved.\n\n🛠 Buy Bot Settings:", reply_markup=_SETTINGS_MARKUP)
 
 # ---------------- CALLBACKS ----------------
+# Anchored, no ".*": PTB runs this against every callback query in the app
+_BT_CALLBACK_RX = re.compile(
+    r"^bt:(?:confirm:[1-9A-HJ-NP-Za-km-z]+|again|set:(?:emoji|supply|minbuy|media|socials|delete|done))$"
+)
+
+# buttons that just switch the wizard stage and prompt: data -> (stage, prompt)
+_CB_PROMPTS = {
+    "bt:again": ("ask_mint", "Okay, send the mint address again."),
+    "bt:set:emoji": ("set_emoji", "Send the emoji you want to use."),
+    "bt:set:supply": ("set_supply", "Send the total supply (number)."),
+    "bt:set:minbuy": ("set_minbuy", f"Send the minimum buy in USD (default {DEFAULT_MIN_BUY_USD})."),
+    "bt:set:media": ("set_media", "Send an image or video to attach to every alert."),
+    "bt:set:socials": (
+        "set_socials",
+        "Send your socials as key:value on separate lines, e.g.\n"
+        "x:https://x.com/your\ninstagram:https://instagram.com/your\nwebsite:https://yoursite.xyz",
+    ),
+}
+
 async def bt_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
     q = update.callback_query
     await q.answer()
     data = q.data or ""
     uid = q.from_user.id
-    state = PENDING_DM.get(uid)
+    state = _dm_state(uid)
     if not state:
         return
 
     origin = state["origin_chat_id"]
     mint = state.get("mint")
 
-    if data == "bt:again":
-        state["stage"] = "ask_mint"
-        await q.message.reply_text("Okay, send the mint address again.")
+    action = _CB_PROMPTS.get(data)
+    if action:
+        state["stage"], prompt = action
+        await q.message.reply_text(prompt)
         return
 
     if data.startswith("bt:confirm:"):
         state["stage"] = "settings"
-        await q.message.reply_text("⚙️ Choose from the following options to customize your Buy Bot:", reply_markup=_settings_keyboard())
-        return
-
-    if data == "bt:set:emoji":
-        state["stage"] = "set_emoji"
-        await q.message.reply_text("Send the emoji you want to use.")
-        return
-
-    if data == "bt:set:supply":
-        state["stage"] = "set_supply"
-        await q.message.reply_text("Send the total supply (number).")
-        return
-
-    if data == "bt:set:minbuy":
-        state["stage"] = "set_minbuy"
-        await q.message.reply_text(f"Send the minimum buy in USD (default {DEFAULT_MIN_BUY_USD}).")
-        return
-
-    if data == "bt:set:media":
-        state["stage"] = "set_media"
-        await q.message.reply_text("Send an image or video to attach to every alert.")
-        return
-
-    if data == "bt:set:socials":
-        state["stage"] = "set_socials"
-        await q.message.reply_text(
-            "Send your socials as key:value on separate lines, e.g.\n"
-            "x:https://x.com/your\ninstagram:https://instagram.com/your\nwebsite:https://yoursite.xyz"
-        )
+        await q.message.reply_text("⚙️ Choose from the following options to customize your Buy Bot:", reply_markup=_SETTINGS_MARKUP)
         return
 
     if data == "bt:set:delete":
         if mint:
-            remove_token(origin, mint)
+            await asyncio.to_thread(remove_token, origin, mint)
         await q.message.reply_text("Token deleted from tracking.")
         PENDING_DM.pop(uid, None)
         return
@@ -1101,10 +1343,9 @@ async def bt_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
             await q.message.reply_text("Missing token context. Please start over with /track in your group.")
             PENDING_DM.pop(uid, None)
         else:
-            set_active(origin, mint, True)
-            row = get_token_row(origin, mint)
-            # best-effort symbol refresh
-            symbol = (row[1] if row else None) or (await fetch_token_info(mint)).get("symbol") or "TOKEN"
+            # one write: every buffered setting plus activation
+            await asyncio.to_thread(upsert_token, origin, mint, **state.get("tmp", {}), active=1)
+            symbol = state.get("symbol") or "TOKEN"
             try:
                 await context.bot.send_message(
                     origin,
@@ -1126,74 +1367,86 @@ async def cmd_untrack(update: Update, context: ContextTypes.DEFAULT_TYPE):
         return
     mint = context.args[0].strip()
     chat_id = update.effective_chat.id
-    remove_token(chat_id, mint)
+    await asyncio.to_thread(remove_token, chat_id, mint)
     await update.message.reply_text(f"🗑 Stopped tracking {short_mint(mint)}.")
 
 async def cmd_list(update: Update, context: ContextTypes.DEFAULT_TYPE):
     chat_id = update.effective_chat.id
-    rows = list_tokens_rows(chat_id)
+    rows = await asyncio.to_thread(list_tokens_rows, chat_id)
     if not rows:
         await update.message.reply_text("No tokens tracked.")
         return
 
-    lines = []
-    for (mint, symbol, media_file_id, emoji, supply, min_buy, socials_json, active) in rows:
-        status = "ON" if active else "OFF"
-        symbol = symbol or "TOKEN"
-        link = f"https://solscan.io/token/{mint}"
-        lines.append(f"• {symbol} — [{short_mint(mint)}]({link}) — min ${min_buy or DEFAULT_MIN_BUY_USD:.2f} — {status}")
+    # HTML + escape(): token symbols are user/third-party text and can break Markdown parsing
+    lines = "\n".join(
+        f"• {escape(symbol or 'TOKEN')} — <a href=\"{SOLSCAN_TOKEN_URL}{mint}\">{short_mint(mint)}</a>"
+        f" — min ${min_buy or DEFAULT_MIN_BUY_USD:.2f} — {'ON' if active else 'OFF'}"
+        for (mint, symbol, media_file_id, emoji, supply, min_buy, socials_json, active) in rows
+    )
 
     await update.message.reply_text(
-        "📋 Tracked tokens:\n" + "\n".join(lines),
+        "📋 Tracked tokens:\n" + lines,
         disable_web_page_preview=True,
-        parse_mode="Markdown"
+        parse_mode="HTML"
     )
 
 # ---------------- WS STARTUP / PRIMING ----------------
-async def prime_ws_for_chat_token(chat_id: int, mint: str):
-    row = get_token_row(chat_id, mint)
-    if not row:
-        return
-    (rmint, symbol, media, emoji, supply, min_buy, socials_json, active) = row
-    if not active:
-        return
-    payload = {
+def _ws_payload(chat_id: int, mint: str, symbol, media, emoji, min_buy, socials_json) -> Dict[str, Any]:
+    return {
         "chat_id": chat_id,
-        "mint": rmint,
+        "mint": mint,
         "symbol": symbol or "TOKEN",
         "emoji": emoji or DEFAULT_EMOJI,
         "min_buy_usd": float(min_buy or DEFAULT_MIN_BUY_USD),
         "socials_json": socials_json or "{}",
         "media_file_id": media
     }
-    await ws_manager.add_or_update_token(payload)
+
+async def prime_ws_for_chat_token(chat_id: int, mint: str):
+    # two near-simultaneous activations of the same token share one subscribe
+    await single_flight(_inflight, ("prime", chat_id, mint), lambda: _prime_ws_for_chat_token(chat_id, mint))
+
+async def _prime_ws_for_chat_token(chat_id: int, mint: str):
+    row = await asyncio.to_thread(get_token_row, chat_id, mint)
+    if not row:
+        return
+    (rmint, symbol, media, emoji, supply, min_buy, socials_json, active) = row
+    if not active:
+        return
+    await ws_manager.add_or_update_token(_ws_payload(chat_id, rmint, symbol, media, emoji, min_buy, socials_json))
 
 async def ws_bootstrap(context: ContextTypes.DEFAULT_TYPE):
     global ws_context
     ws_context = context  # allow ws_manager to send via bot
     await ws_manager.ensure_connected()
 
-    # Subscribe all active tokens
-    conn = sqlite3.connect(DB_PATH)
-    c = conn.cursor()
-    c.execute("""SELECT chat_id, mint FROM tracked_tokens WHERE active=1""")
-    rows = c.fetchall()
-    conn.close()
-
-    for chat_id, mint in rows:
-        await prime_ws_for_chat_token(chat_id, mint)
+    # Subscribe all active tokens: payloads come straight from the one active-rows query,
+    # pair lookups are warmed in batches, then every subscription is registered concurrently
+    rows = await asyncio.to_thread(_load_active_rows)
+    await fetch_primary_pairs([row[1] for row in rows])
+    results = await asyncio.gather(
+        *(
+            ws_manager.add_or_update_token(_ws_payload(chat_id, mint, symbol, media, emoji, min_buy, socials_json))
+            for chat_id, mint, media, symbol, emoji, min_buy, socials_json, *_rest in rows
+        ),
+        return_exceptions=True,
+    )
+    for (chat_id, mint, *_rest), r in zip(rows, results):
+        if isinstance(r, Exception):
+            logging.error(f"WS prime failed for {short_mint(mint)} in {chat_id}: {r}")
 
 # ---------------- REGISTER ----------------
 def register_buytracker(app):
+    # Alerts fan out concurrently and the DM flow replies freely; both rely on the Application
+    # being built with .rate_limiter(AIORateLimiter(...)) (see bot.py) to stay under Telegram's limits.
+    if getattr(app.bot, "rate_limiter", None) is None:
+        logging.warning("Buy tracker registered without an AIORateLimiter; alert bursts may hit Telegram 429s")
     init_db()
 
     # GROUP command
     app.add_handler(CommandHandler("track", cmd_track_group, filters.ChatType.GROUPS))
 
-    # DM entry via "track <code>" — VERY high priority
-    app.add_handler(MessageHandler(filters.ChatType.PRIVATE & filters.TEXT, dm_entry_by_code), group=-300)
-
-    # High-priority DM gate for buy tracker (accept text + media w/ captions)
+    # High-priority DM gate for buy tracker: "track <code>" entry + wizard input (text + media w/ captions)
     app.add_handler(
         MessageHandler(
             filters.ChatType.PRIVATE & (filters.TEXT | filters.PHOTO | filters.VIDEO | filters.Document.ALL),
@@ -1203,7 +1456,7 @@ def register_buytracker(app):
     )
 
     # DM callbacks & text/media during configuration
-    app.add_handler(CallbackQueryHandler(bt_callback, pattern=r"^bt:(confirm|again|set:.*)"))
+    app.add_handler(CallbackQueryHandler(bt_callback, pattern=_BT_CALLBACK_RX))
     app.add_handler(MessageHandler(filters.ChatType.PRIVATE & filters.TEXT, dm_text_router))
     app.add_handler(MessageHandler(filters.ChatType.PRIVATE & (filters.PHOTO | filters.VIDEO | filters.Document.ALL), dm_media_router))
 
@@ -1216,3 +1469,11 @@ def register_buytracker(app):
 
     # Failsafe low-frequency poller (kept, but you can remove if you want pure WS)
     app.job_queue.run_repeating(fallback_poll, interval=60, first=10)
+    app.job_queue.run_repeating(sweep_pair_codes, interval=PAIR_CODE_SWEEP_SEC, first=PAIR_CODE_SWEEP_SEC)
+
+    prev_shutdown = app.post_shutdown
+    async def _post_shutdown(application):
+        if prev_shutdown:
+            await prev_shutdown(application)
+        await _close_http()
+    app.post_shutdown = _post_shutdown
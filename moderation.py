@@ -1,7 +1,8 @@
 # modules/moderation.py
-import os, json, logging
+import os, re, json, time, logging, asyncio
 from pathlib import Path
-from datetime import datetime
+from string import Template
+from cachetools import TTLCache
 from typing import Dict, Any, Optional, Tuple, List
 
 from telegram import (
@@ -20,10 +21,14 @@ from telegram.ext import (
     filters,
 )
 
+from aio_utils import spawn
+
 # -------- SETTINGS --------
 DEFAULT_WELCOME = "🎉 Welcome {name} to the group! Please read the rules."
 warn_limit = 3
-warnings: Dict[int, int] = {}  # Store warnings per user
+WARN_TTL_SEC = 24 * 3600  # a user's warning count resets after a quiet day
+# Warnings live in application.user_data[uid]["warnings"] = (count, last_ts),
+# so they survive restarts via the app's persistence (see bot.py).
 
 # In-memory caches (persisted to JSON)
 welcome_messages: Dict[int, str] = {}         # chat_id -> str
@@ -31,6 +36,20 @@ rules_texts: Dict[int, str] = {}              # chat_id -> str
 filters_map: Dict[int, Dict[str, str]] = {}   # chat_id -> {trigger: reply}
 known_chats: Dict[int, str] = {}              # chat_id -> title
 
+# chat_id -> compiled welcome Template (built on first join, dropped when the text changes)
+_WELCOME_TPL: Dict[int, Template] = {}
+
+# Joins/leaves arrive both as service messages and as chat_member updates;
+# (chat_id, user_id, "join"|"leave") keys seen recently are handled once.
+_SEEN_MEMBER_EVENTS: TTLCache = TTLCache(maxsize=4096, ttl=10)
+
+def _first_seen(chat_id: int, user_id: int, kind: str) -> bool:
+    key = (chat_id, user_id, kind)
+    if key in _SEEN_MEMBER_EVENTS:
+        return False
+    _SEEN_MEMBER_EVENTS[key] = None
+    return True
+
 # Pending interactive states
 PENDING_WELCOME_DM: Dict[int, int] = {}  # user_id -> target_chat_id
 PENDING_RULES_DM: Dict[int, int] = {}    # user_id -> target_chat_id
@@ -43,6 +62,39 @@ ADD_TO_GROUP_URL = (
     "&admin=change_info+delete_messages+ban_users+invite_users+pin_messages"
 )
 
+# Static replies (built once at import)
+_START_TEXT = (
+    "🎩 <b>Welcome to SentriBot!</b>\n"
+    "Your private, project-only community monitoring & alerts bot.\n\n"
+    "<b>What you get:</b>\n"
+    "• Real-time Buy & Sell alerts (wallet + TX links)\n"
+    "• X follower alerts (track your project account)\n"
+    "• Member joins/leaves, spam control, keyword tracking\n"
+    "• Fully private — you control every feature\n\n"
+    "<b>How to start:</b>\n"
+    "Add SentriBot to your group as <b>Admin</b> with <b>write + pin + delete + ban + invite</b> permissions.\n"
+    "Make sure all admin permissions are <b>enabled</b> before confirming.\n\n"
+    "<i>If no confirmation appears after adding, type</i> /continue <i>in your group.</i>\n\n"
+    "Work with SentriBot? DM @brhm_sol"
+)
+_START_KB = InlineKeyboardMarkup(
+    [
+        [InlineKeyboardButton("➕ Add me to your group", url=ADD_TO_GROUP_URL)],
+        [InlineKeyboardButton("⚙️ Configure groups", callback_data="cfgmenu")],
+    ]
+)
+_ABOUT_TEXT = (
+    "🤖 <b>Welcome to SentriBot</b> — Your private community monitoring and insights assistant.\n\n"
+    "📊 <b>With SentriBot, you can:</b>\n"
+    "• Track member activity and engagement.\n"
+    "• Get alerts when members join or leave.\n"
+    "• Monitor keywords and detect mood changes in chats.\n"
+    "• Watch for mentions of your token or ticker on X.\n"
+    "• Receive blockchain whale and wallet activity alerts.\n"
+    "• Get notified when someone follows your X account.\n\n"
+    "🔒 <b>You control all data.</b> SentriBot is private and built for your project."
+)
+
 # -------- Namespaced persistence (set after bot username is known) --------
 DATA_BASE = Path("data")
 DATA_DIR = DATA_BASE  # will be overwritten by _namespace_data()
@@ -157,11 +209,19 @@ def _render_help_section(section: str) -> Tuple[str, InlineKeyboardMarkup]:
         text = "<b>✨ SentriBot Help</b>\nTap a category below to see commands."
     return text, kb
 
+# All sections are static -> render once, serve from cache
+_HELP_CACHE: Dict[str, Tuple[str, InlineKeyboardMarkup]] = {
+    s: _render_help_section(s) for s in ("menu", "general", "buy", "sell", "x")
+}
+
+def _help_section(section: str) -> Tuple[str, InlineKeyboardMarkup]:
+    return _HELP_CACHE.get((section or "menu").lower(), _HELP_CACHE["menu"])
+
 async def help_menu_cb(update: Update, context: ContextTypes.DEFAULT_TYPE):
     q = update.callback_query
     await q.answer()
     _, section = (q.data.split(":", 1) + ["menu"])[:2]
-    text, kb = _render_help_section(section)
+    text, kb = _help_section(section)
     try:
         await q.edit_message_text(text=text, reply_markup=kb, parse_mode="HTML")
     except Exception as e:
@@ -223,27 +283,7 @@ async def start(update: Update, context: ContextTypes.DEFAULT_TYPE):
                     pass
 
         # No tracker/cfg payload -> show intro (unchanged)
-        text = (
-            "🎩 <b>Welcome to SentriBot!</b>\n"
-            "Your private, project-only community monitoring & alerts bot.\n\n"
-            "<b>What you get:</b>\n"
-            "• Real-time Buy & Sell alerts (wallet + TX links)\n"
-            "• X follower alerts (track your project account)\n"
-            "• Member joins/leaves, spam control, keyword tracking\n"
-            "• Fully private — you control every feature\n\n"
-            "<b>How to start:</b>\n"
-            "Add SentriBot to your group as <b>Admin</b> with <b>write + pin + delete + ban + invite</b> permissions.\n"
-            "Make sure all admin permissions are <b>enabled</b> before confirming.\n\n"
-            "<i>If no confirmation appears after adding, type</i> /continue <i>in your group.</i>\n\n"
-            "Work with SentriBot? DM @brhm_sol"
-        )
-        kb = InlineKeyboardMarkup(
-            [
-                [InlineKeyboardButton("➕ Add me to your group", url=ADD_TO_GROUP_URL)],
-                [InlineKeyboardButton("⚙️ Configure groups", callback_data="cfgmenu")],
-            ]
-        )
-        await update.message.reply_text(text, reply_markup=kb, parse_mode="HTML")
+        await update.message.reply_text(_START_TEXT, reply_markup=_START_KB, parse_mode="HTML")
         return
 
     # In groups
@@ -269,12 +309,12 @@ async def cfgmenu_cb(update: Update, context: ContextTypes.DEFAULT_TYPE):
     await q.message.reply_text("Select a group to configure:", reply_markup=kb)
 
 async def continue_cmd(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    text, kb = _render_help_section("menu")
+    text, kb = _HELP_CACHE["menu"]
     await update.message.reply_text(text, reply_markup=kb, parse_mode="HTML")
 
 async def help_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     section = (context.args[0] if context.args else "menu")
-    text, kb = _render_help_section(section)
+    text, kb = _help_section(section)
     await update.message.reply_text(text, reply_markup=kb, parse_mode="HTML")
 
 async def rules(update: Update, context: ContextTypes.DEFAULT_TYPE):
@@ -288,18 +328,7 @@ async def rules(update: Update, context: ContextTypes.DEFAULT_TYPE):
     await update.message.reply_text(txt)
 
 async def about(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    await update.message.reply_text(
-        "🤖 <b>Welcome to SentriBot</b> — Your private community monitoring and insights assistant.\n\n"
-        "📊 <b>With SentriBot, you can:</b>\n"
-        "• Track member activity and engagement.\n"
-        "• Get alerts when members join or leave.\n"
-        "• Monitor keywords and detect mood changes in chats.\n"
-        "• Watch for mentions of your token or ticker on X.\n"
-        "• Receive blockchain whale and wallet activity alerts.\n"
-        "• Get notified when someone follows your X account.\n\n"
-        "🔒 <b>You control all data.</b> SentriBot is private and built for your project.",
-        parse_mode="HTML"
-    )
+    await update.message.reply_text(_ABOUT_TEXT, parse_mode="HTML")
 
 # -------- ADMIN COMMANDS --------
 async def set_welcome(update: Update, context: ContextTypes.DEFAULT_TYPE):
@@ -334,15 +363,28 @@ async def set_rules(update: Update, context: ContextTypes.DEFAULT_TYPE):
         return
     await update.message.reply_text("Use /start → “⚙️ Configure groups” to pick a group.")
 
+def _add_warning(context: ContextTypes.DEFAULT_TYPE, uid: int) -> int:
+    """Bump the warned user's counter (not the caller's) and mark it for persistence."""
+    app = context.application
+    data = app.user_data[uid]
+    count, last_ts = data.get("warnings", (0, 0.0))
+    now = time.time()
+    if now - last_ts > WARN_TTL_SEC:
+        count = 0
+    count += 1
+    data["warnings"] = (count, now)
+    app.mark_data_for_update_persistence(user_ids=uid)
+    return count
+
 async def warn_user(update: Update, context: ContextTypes.DEFAULT_TYPE):
     if not update.message.reply_to_message:
         await update.message.reply_text("❌ Reply to a user's message to warn them.")
         return
     user = update.message.reply_to_message.from_user
     uid = user.id
-    warnings[uid] = warnings.get(uid, 0) + 1
-    await update.message.reply_text(f"⚠ {user.first_name} has been warned! ({warnings[uid]}/{warn_limit})")
-    if warnings[uid] >= warn_limit:
+    count = _add_warning(context, uid)
+    await update.message.reply_text(f"⚠ {user.first_name} has been warned! ({count}/{warn_limit})")
+    if count >= warn_limit:
         await update.message.chat.ban_member(uid)
         await update.message.reply_text(f"🚫 {user.first_name} was banned after too many warnings.")
 
@@ -354,30 +396,51 @@ async def pin_message(update: Update, context: ContextTypes.DEFAULT_TYPE):
         await update.message.reply_text("❌ Reply to a message to pin it.")
 
 # -------- AUTO FEATURES (message-based) --------
+def _welcome_template(chat_id: int) -> Template:
+    tpl = _WELCOME_TPL.get(chat_id)
+    if tpl is None:
+        raw = welcome_messages.get(chat_id, DEFAULT_WELCOME)
+        tpl = _WELCOME_TPL[chat_id] = Template(raw.replace("$", "$$").replace("{name}", "${name}"))
+    return tpl
+
 async def welcome(update: Update, context: ContextTypes.DEFAULT_TYPE):
     chat_id = update.effective_chat.id
-    message_template = welcome_messages.get(chat_id, DEFAULT_WELCOME)
-    for member in update.message.new_chat_members:
-        if member.is_bot:
-            await update.message.chat.ban_member(member.id)
-            await update.message.reply_text(f"🤖 Bot {member.first_name} was removed.")
-            return
-        await update.message.reply_text(
-            message_template.format(name=member.mention_html()),
-            parse_mode="HTML"
+    msg = update.message
+    bots, humans = [], []
+    for member in msg.new_chat_members:
+        if not _first_seen(chat_id, member.id, "join"):
+            continue
+        (bots if member.is_bot else humans).append(member)
+
+    # One notice per update, however many members arrived together
+    if bots:
+        for bot_member in bots:
+            await msg.chat.ban_member(bot_member.id)
+        names = ", ".join(b.first_name for b in bots)
+        await msg.reply_text(
+            f"🤖 Bot {names} was removed." if len(bots) == 1 else f"🤖 Bots {names} were removed.",
+            disable_notification=True,
         )
-        await log_activity(f"User joined: {member.full_name}")
+    if humans:
+        mentions = ", ".join(m.mention_html() for m in humans)
+        await msg.reply_text(_welcome_template(chat_id).safe_substitute(name=mentions), parse_mode="HTML", disable_notification=True)
+        log_activity("User joined: " + ", ".join(m.full_name for m in humans))
 
 async def goodbye(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    if update.message.left_chat_member:
-        await update.message.reply_text(f"👋 Goodbye {update.message.left_chat_member.full_name}!")
-        await log_activity(f"User left: {update.message.left_chat_member.full_name}")
+    gone = update.message.left_chat_member
+    if gone and _first_seen(update.effective_chat.id, gone.id, "leave"):
+        full = gone.full_name
+        await update.message.reply_text(f"👋 Goodbye {full}!", disable_notification=True)
+        log_activity(f"User left: {full}")
 
 # -------- ChatMember updates (users) --------
+_LEFT = frozenset(("left", "kicked"))
+_JOINED = frozenset(("member", "administrator", "creator"))
+
 def _status_change(old, new):
     try:
-        return (old.status != new.status) or (old.is_member != new.is_member)
-    except Exception:
+        return old.status != new.status or old.is_member != new.is_member
+    except AttributeError:  # is_member only exists on restricted members
         return True
 
 async def user_member_update(update: Update, context: ContextTypes.DEFAULT_TYPE):
@@ -388,28 +451,32 @@ async def user_member_update(update: Update, context: ContextTypes.DEFAULT_TYPE)
     if not _status_change(old, new):
         return
 
-    joined = (not getattr(old, "is_member", False) and getattr(new, "is_member", False)) or (
-        old.status in ("left", "kicked") and new.status in ("member", "administrator", "creator")
-    )
-    left = (getattr(old, "is_member", False) and not getattr(new, "is_member", False)) or (
-        new.status in ("left", "kicked")
-    )
+    old_status, new_status = old.status, new.status
+    was_member = getattr(old, "is_member", False)
+    is_member = getattr(new, "is_member", False)
+    joined = (not was_member and is_member) or (old_status in _LEFT and new_status in _JOINED)
+    left = (was_member and not is_member) or new_status in _LEFT
 
+    chat = cmu.chat
+    chat_id = chat.id
+    user = new.user
     if joined:
-        chat = cmu.chat
-        _remember_chat(chat.id, chat.title or str(chat.id))
-        user = cmu.from_user
+        if not _first_seen(chat_id, user.id, "join"):
+            return
+        _remember_chat(chat_id, chat.title or str(chat_id))
         if user.is_bot:
-            await context.bot.ban_chat_member(chat.id, user.id)
-            await context.bot.send_message(chat.id, f"🤖 Bot {user.first_name} was removed.")
+            await context.bot.ban_chat_member(chat_id, user.id)
+            await context.bot.send_message(chat_id, f"🤖 Bot {user.first_name} was removed.", disable_notification=True)
         else:
-            template = welcome_messages.get(chat.id, DEFAULT_WELCOME)
-            await context.bot.send_message(chat.id, template.format(name=user.mention_html()), parse_mode="HTML")
-            await log_activity(f"User joined: {user.full_name}")
+            text = _welcome_template(chat_id).safe_substitute(name=user.mention_html())
+            await context.bot.send_message(chat_id, text, parse_mode="HTML", disable_notification=True)
+            log_activity(f"User joined: {user.full_name}")
     elif left:
-        user = cmu.from_user
-        await context.bot.send_message(cmu.chat.id, f"👋 Goodbye {user.full_name}!")
-        await log_activity(f"User left: {user.full_name}")
+        if not _first_seen(chat_id, user.id, "leave"):
+            return
+        full = user.full_name
+        await context.bot.send_message(chat_id, f"👋 Goodbye {full}!", disable_notification=True)
+        log_activity(f"User left: {full}")
 
 # -------- My Chat Member updates (bot itself added/removed) --------
 async def my_bot_member_update(update: Update, context: ContextTypes.DEFAULT_TYPE):
@@ -529,6 +596,7 @@ async def handle_dm_text(update: Update, context: ContextTypes.DEFAULT_TYPE):
         text = msg.text.strip()
         final = "{name} " + text  # ensure tag first
         welcome_messages[target_chat] = final
+        _WELCOME_TPL.pop(target_chat, None)
         try:
             _save_json(PATH_WELCOME, {str(k): v for k, v in welcome_messages.items()})
             title = known_chats.get(target_chat, str(target_chat))
@@ -613,35 +681,111 @@ async def cfgpick_cb(update: Update, context: ContextTypes.DEFAULT_TYPE):
         )
 
 # -------- SPAM DETECTION (simple & early) --------
-SPAM_KEYWORDS = os.getenv("SPAM_KEYWORDS", "")
-SPAM_KEYWORDS = [w.strip().lower() for w in SPAM_KEYWORDS.split(",") if w.strip()]
+SPAM_KEYWORDS: Tuple[str, ...] = tuple(
+    filter(None, (w.strip().lower() for w in os.getenv("SPAM_KEYWORDS", "").split(",")))
+)
+SPAM_KEYWORD_SET = frozenset(SPAM_KEYWORDS)
+
+def _build_spam_rx(keywords) -> Optional["re.Pattern[str]"]:
+    """One case-insensitive alternation (longest first) -> a single scan per message."""
+    if not keywords:
+        return None
+    alts = sorted(keywords, key=len, reverse=True)
+    return re.compile("|".join(re.escape(w) for w in alts), re.IGNORECASE)
+
+_SPAM_RX = _build_spam_rx(SPAM_KEYWORD_SET)
+
+def _build_spam_lut(keywords) -> Optional[bytes]:
+    """
+    Delete-table for bytes.translate: every byte that cannot start a keyword.
+    None when a keyword starts with a non-ASCII char (no cheap byte test then).
+    """
+    firsts = {w[0] for w in keywords}
+    if not firsts or not all(c.isascii() for c in firsts):
+        return None
+    starts = {ord(c) for f in firsts for c in (f.lower(), f.upper())}
+    return bytes(b for b in range(256) if b not in starts)
 
-def _spam_text(msg) -> str:
-    return (msg.text or msg.caption or "").lower()
+_SPAM_NON_FIRST = _build_spam_lut(SPAM_KEYWORDS)
+
+class _SpamCandidate(filters.MessageFilter):
+    """Cheap pre-check: does the text contain any byte a keyword can start with?"""
+    __slots__ = ()
+
+    def filter(self, message) -> bool:
+        text = message.text or message.caption
+        return bool(text) and bool(text.encode("utf-8", "ignore").translate(None, _SPAM_NON_FIRST))
 
 async def detect_spam(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Only reached for messages the keyword filter already matched (see register_moderation)."""
     msg = update.message
-    if not msg or not SPAM_KEYWORDS:
+    if not msg:
         return
-    text = _spam_text(msg)
-    if text and any(kw in text for kw in SPAM_KEYWORDS):
-        chat_id = update.effective_chat.id
-        user_name = msg.from_user.first_name
-        try:
-            await context.bot.delete_message(chat_id=chat_id, message_id=msg.message_id)
-            await context.bot.send_message(chat_id=chat_id, text=f"🚫 Spam detected from {user_name}")
-            await warn_user(update, context)
-        except Exception as e:
-            logging.warning("Spam delete failed in %s: %s", chat_id, e)
+    chat_id = update.effective_chat.id
+    user_name = msg.from_user.first_name
+    try:
+        await context.bot.delete_message(chat_id=chat_id, message_id=msg.message_id)
+        await context.bot.send_message(chat_id=chat_id, text=f"🚫 Spam detected from {user_name}")
+        await warn_user(update, context)
+    except Exception as e:
+        logging.warning("Spam delete failed in %s: %s", chat_id, e)
 
 # -------- LOGGING & UTILS --------
-async def log_activity(text):
+# Activity lines are queued by the handlers and appended in batches by a single
+# background writer, so joins/leaves never wait on disk I/O.
+ACTIVITY_BATCH_SIZE = 64
+ACTIVITY_FLUSH_SEC = 1.0
+_LOG_QUEUE: "asyncio.Queue[Tuple[float, str]]" = asyncio.Queue()
+_log_task: Optional[asyncio.Task] = None
+_stamp_cache: Dict[int, str] = {}  # epoch second -> formatted stamp (current second only)
+
+def log_activity(text):
+    _LOG_QUEUE.put_nowait((time.time(), text))
+
+def _stamp(ts: float) -> str:
+    sec = int(ts)
+    stamp = _stamp_cache.get(sec)
+    if stamp is None:
+        _stamp_cache.clear()
+        stamp = _stamp_cache[sec] = time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(sec))
+    return stamp
+
+def _append_activity(records: List[Tuple[float, str]]):
     try:
         with PATH_ACTIVITY.open("a", encoding="utf-8") as f:
-            f.write(f"[{datetime.now()}] {text}\n")
+            f.write("".join(f"[{_stamp(ts)}] {text}\n" for ts, text in records))
     except Exception as e:
         logging.warning("Failed to write activity log: %s", e)
 
+async def _log_worker():
+    while True:
+        batch = [await _LOG_QUEUE.get()]
+        try:
+            while len(batch) < ACTIVITY_BATCH_SIZE:
+                batch.append(await asyncio.wait_for(_LOG_QUEUE.get(), timeout=ACTIVITY_FLUSH_SEC))
+        except asyncio.TimeoutError:
+            pass
+        except asyncio.CancelledError:
+            _append_activity(batch)
+            raise
+        await asyncio.to_thread(_append_activity, batch)
+
+async def _flush_activity():
+    """Stop the writer and append whatever is still queued."""
+    global _log_task
+    task, _log_task = _log_task, None
+    if task:
+        task.cancel()
+        try:
+            await task  # its CancelledError handler appends the batch it had already pulled
+        except asyncio.CancelledError:
+            pass
+    batch = []
+    while not _LOG_QUEUE.empty():
+        batch.append(_LOG_QUEUE.get_nowait())
+    if batch:
+        _append_activity(batch)
+
 async def cmd_activity(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Admins only: /activity [N] -> show last N lines (default 50)."""
     chat = update.effective_chat
@@ -684,8 +828,7 @@ async def cmd_spamtest(update: Update, context: ContextTypes.DEFAULT_TYPE):
     if not sample:
         await update.message.reply_text("Usage: /spamtest your sample text")
         return
-    content_norm = _normalize_spaces(sample)
-    hits = [kw for kw in SPAM_KEYWORDS if kw and kw in content_norm]
+    hits = sorted({m.group(0).lower() for m in _SPAM_RX.finditer(sample)}) if _SPAM_RX else []
     if hits:
         await update.message.reply_text("Matched keywords: " + ", ".join(hits))
     else:
@@ -695,10 +838,15 @@ async def cmd_spamtest(update: Update, context: ContextTypes.DEFAULT_TYPE):
 def register_moderation(app: Application):
     # Post-init: set namespaced storage once bot username is known
     async def _post_init(application: Application):
-        me = await application.bot.get_me()
-        _namespace_data(me.username)
+        global _log_task
+        _namespace_data(application.bot.username)  # cached by initialize(); no extra getMe
+        _log_task = spawn(_log_worker())
+
+    async def _post_shutdown(application: Application):
+        await _flush_activity()
 
     app.post_init = _post_init
+    app.post_shutdown = _post_shutdown
 
     # Commands
     app.add_handler(CommandHandler("start", start))
@@ -733,7 +881,11 @@ def register_moderation(app: Application):
 
     # Group text handler first (filters & interactive replies), then spam
     app.add_handler(MessageHandler(filters.TEXT & ~filters.COMMAND, handle_group_text), group=0)
-    app.add_handler(MessageHandler((filters.TEXT | filters.Caption()) & ~filters.COMMAND, detect_spam), group=-5)
+    if _SPAM_RX:
+        spam_filter = (filters.Regex(_SPAM_RX) | filters.CaptionRegex(_SPAM_RX)) & ~filters.COMMAND
+        if _SPAM_NON_FIRST is not None:
+            spam_filter = _SpamCandidate() & spam_filter
+        app.add_handler(MessageHandler(spam_filter, detect_spam), group=-5)
    
     # Membership updates
     app.add_handler(ChatMemberHandler(user_member_update, ChatMemberHandler.CHAT_MEMBER))
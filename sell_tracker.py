@@ -1,31 +1,58 @@
 import os
+import time
+import random
 import sqlite3
+import asyncio
 import logging
+import threading
+import httpx
 import aiohttp
+import orjson
+from collections import OrderedDict
+from functools import lru_cache
 
 from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
 from telegram.ext import CommandHandler, MessageHandler, ContextTypes, filters
 
+from aio_utils import spawn, single_flight, first_by_priority
+
 # ---------- SETTINGS ----------
 HELIUS_API_KEY = os.getenv("HELIUS_API_KEY")
 DB_PATH = "tracked_tokens.db"
 logging.basicConfig(level=logging.INFO)
+logging.getLogger("httpx").setLevel(logging.WARNING)  # per-request INFO lines would leak the API key in HELIUS_URL
 
 # Native SOL placeholder (not an SPL mint)
 NATIVE_SOL_MINTS = {"So11111111111111111111111111111111111111112"}
+_NATIVE_SOL_SQL = f"mint NOT IN ({', '.join('?' * len(NATIVE_SOL_MINTS))})"  # bind with tuple(NATIVE_SOL_MINTS)
 def is_native_sol(mint: str) -> bool:
     return mint in NATIVE_SOL_MINTS
 
 # External APIs
 HELIUS_URL = f"https://mainnet.helius-rpc.com/?api-key={HELIUS_API_KEY}"
+HELIUS_WS_URL = f"wss://mainnet.helius-rpc.com/?api-key={HELIUS_API_KEY}" if HELIUS_API_KEY else None
 DEXSCREENER_URL = "https://api.dexscreener.com/latest/dex/tokens/{}"
 COINGECKO_URL = "https://api.coingecko.com/api/v3/coins/solana/contract/{}"
 PUMPFUN_URL = "https://api.pump.fun/v1/token/{}"  # best-effort
 
 # ---------- DB ----------
+_db = None  # process-wide connection, opened by init_sell_db
+_db_lock = threading.Lock()  # writes run in worker threads (asyncio.to_thread); one at a time on the shared connection
+# (chat_id, mint) -> [media_file_id, symbol, usd_threshold]; mirrors sell_tracked so polling never reads disk
+_sell_rows = {}
+
+def _conn() -> sqlite3.Connection:
+    global _db
+    if _db is None:
+        # autocommit; WAL lets this reader run alongside the other trackers' writers on the same file
+        _db = sqlite3.connect(DB_PATH, check_same_thread=False, isolation_level=None)
+        _db.execute("PRAGMA journal_mode=WAL")
+        _db.execute("PRAGMA synchronous=NORMAL")
+        _db.execute("PRAGMA busy_timeout=5000")
+    return _db
+
 def init_sell_db():
-    conn = sqlite3.connect(DB_PATH)
-    c = conn.cursor()
+    c = _conn()
     c.execute("""
         CREATE TABLE IF NOT EXISTS sell_tracked (
             chat_id INTEGER,
@@ -44,89 +71,114 @@ def init_sell_db():
     if "usd_threshold" not in cols:
         try: c.execute("ALTER TABLE sell_tracked ADD COLUMN usd_threshold REAL")
         except Exception: pass
-    conn.commit()
-    conn.close()
-
-def sell_add_token(chat_id, mint, media_file_id=None, symbol=None, usd_threshold=None):
+    if "last_sig" not in cols:
+        try: c.execute("ALTER TABLE sell_tracked ADD COLUMN last_sig TEXT")
+        except Exception: pass
+    _sell_rows.clear()
+    for chat_id, mint, media_file_id, symbol, usd_threshold in c.execute(
+        f"SELECT chat_id, mint, media_file_id, symbol, usd_threshold FROM sell_tracked WHERE {_NATIVE_SOL_SQL}",
+        tuple(NATIVE_SOL_MINTS),
+    ):
+        _sell_rows[(chat_id, mint)] = [media_file_id, symbol, usd_threshold]
+    # resume from the last handled signature so a restart doesn't re-alert
+    sell_last_seen.update(c.execute("SELECT mint, last_sig FROM sell_tracked WHERE last_sig IS NOT NULL"))
+
+_UPSERT_SQL = """
+    INSERT INTO sell_tracked (chat_id, mint, media_file_id, symbol, usd_threshold)
+    VALUES (?, ?, ?, ?, ?)
+    ON CONFLICT(chat_id, mint) DO UPDATE SET
+        media_file_id = COALESCE(excluded.media_file_id, sell_tracked.media_file_id),
+        symbol       = COALESCE(excluded.symbol,       sell_tracked.symbol),
+        usd_threshold= COALESCE(excluded.usd_threshold,sell_tracked.usd_threshold)
+"""
+
+def _write(sql: str, params=()):
+    with _db_lock:
+        _conn().execute(sql, params)
+
+def _write_many(sql: str, rows):
+    """executemany inside one transaction (one commit instead of one per row)."""
+    with _db_lock:
+        c = _conn()
+        c.execute("BEGIN IMMEDIATE")
+        try:
+            c.executemany(sql, rows)
+        except Exception:
+            c.execute("ROLLBACK")
+            raise
+        c.execute("COMMIT")
+
+# The helpers below are async: the disk write runs off the event loop, while the
+# _sell_rows mirror is only ever touched on the loop (pollers iterate it there).
+async def sell_add_tokens(rows_in):
     """
-    Robust upsert: always creates the row; preserves existing symbol/threshold unless new values are provided.
+    Robust upsert of (chat_id, mint, media_file_id, symbol, usd_threshold) rows: always creates the row;
+    preserves existing media/symbol/threshold unless new values are provided.
     """
-    conn = sqlite3.connect(DB_PATH)
-    c = conn.cursor()
-    c.execute("""
-        INSERT INTO sell_tracked (chat_id, mint, media_file_id, symbol, usd_threshold)
-        VALUES (?, ?, ?, ?, ?)
-        ON CONFLICT(chat_id, mint) DO UPDATE SET
-            media_file_id = COALESCE(excluded.media_file_id, sell_tracked.media_file_id),
-            symbol       = COALESCE(excluded.symbol,       sell_tracked.symbol),
-            usd_threshold= COALESCE(excluded.usd_threshold,sell_tracked.usd_threshold)
-    """, (chat_id, mint, media_file_id, symbol, usd_threshold))
-    conn.commit()
-    conn.close()
-
-def sell_update_symbol(mint: str, symbol: str):
-    conn = sqlite3.connect(DB_PATH)
-    c = conn.cursor()
-    c.execute("UPDATE sell_tracked SET symbol=? WHERE mint=?", (symbol, mint))
-    conn.commit()
-    conn.close()
-
-def sell_update_threshold(chat_id: int, mint: str, usd_threshold: float):
-    conn = sqlite3.connect(DB_PATH)
-    c = conn.cursor()
-    c.execute("UPDATE sell_tracked SET usd_threshold=? WHERE chat_id=? AND mint=?", (usd_threshold, chat_id, mint))
-    conn.commit()
-    conn.close()
-
-def sell_remove_token(chat_id, mint):
-    conn = sqlite3.connect(DB_PATH)
-    c = conn.cursor()
-    c.execute("DELETE FROM sell_tracked WHERE chat_id=? AND mint=?", (chat_id, mint))
-    conn.commit()
-    conn.close()
+    rows = []
+    for row in rows_in:
+        if is_native_sol(row[1]):
+            logging.warning(f"sell_add_tokens: refusing native SOL for chat {row[0]}")
+        else:
+            rows.append(row)
+    if not rows:
+        return
+    await asyncio.to_thread(_write_many, _UPSERT_SQL, rows)
+    for chat_id, mint, *vals in rows:
+        row = _sell_rows.setdefault((chat_id, mint), [None, None, None])
+        for i, v in enumerate(vals):
+            if v is not None:
+                row[i] = v
+    _ws_wake.set()
+
+async def sell_add_token(chat_id, mint, media_file_id=None, symbol=None, usd_threshold=None):
+    await sell_add_tokens([(chat_id, mint, media_file_id, symbol, usd_threshold)])
+
+async def sell_update_symbol(mint: str, symbol: str):
+    await asyncio.to_thread(_write, "UPDATE sell_tracked SET symbol=? WHERE mint=?", (symbol, mint))
+    for (_chat_id, m), row in _sell_rows.items():
+        if m == mint:
+            row[1] = symbol
+
+async def sell_update_threshold(chat_id: int, mint: str, usd_threshold: float):
+    await asyncio.to_thread(
+        _write, "UPDATE sell_tracked SET usd_threshold=? WHERE chat_id=? AND mint=?", (usd_threshold, chat_id, mint)
+    )
+    row = _sell_rows.get((chat_id, mint))
+    if row:
+        row[2] = usd_threshold
+
+async def sell_remove_token(chat_id, mint):
+    await asyncio.to_thread(_write, "DELETE FROM sell_tracked WHERE chat_id=? AND mint=?", (chat_id, mint))
+    _sell_rows.pop((chat_id, mint), None)
+    if not any(m == mint for _chat_id, m in _sell_rows):
+        sell_last_seen.pop(mint, None)  # only tracked mints keep a cursor
+        _ws_wake.set()
+
+async def sell_save_last_seen(sigs):
+    """sigs: {mint: signature} handled this tick."""
+    await asyncio.to_thread(
+        _write_many, "UPDATE sell_tracked SET last_sig=? WHERE mint=?", [(sig, mint) for mint, sig in sigs.items()]
+    )
 
 def sell_list_rows(chat_id):
-    conn = sqlite3.connect(DB_PATH)
-    c = conn.cursor()
-    c.execute("SELECT mint, media_file_id, symbol, usd_threshold FROM sell_tracked WHERE chat_id=?", (chat_id,))
-    rows = c.fetchall()
-    conn.close()
-    return rows
+    """(mint, media_file_id, symbol, usd_threshold) rows for a chat, straight from the in-memory mirror."""
+    return [(mint, *vals) for (c, mint), vals in _sell_rows.items() if c == chat_id]
 
 # ---------- HELPERS ----------
-def fmt_num(x):
-    try:
-        n = float(x or 0)
-        return f"{n:,.0f}"
-    except Exception:
-        return str(x)
-
-def fmt_price(x):
-    try:
-        n = float(x or 0)
-        return f"{n:.8f}" if n < 1 else f"{n:.4f}"
-    except Exception:
-        return str(x)
-
+# Callers pass numbers (or None) already coerced with float(... or 0), so no try/except here
 def fmt_amount(x):
-    try:
-        n = float(x or 0)
-        if n == 0:
-            return "0"
-        if n < 1:
-            return f"{n:.6f}".rstrip("0").rstrip(".")
-        if n < 1000:
-            return f"{n:.4f}".rstrip("0").rstrip(".")
-        return f"{n:,.2f}"
-    except Exception:
-        return str(x)
+    n = float(x or 0)
+    if n == 0:
+        return "0"
+    if n < 1:
+        return f"{n:.6f}".rstrip("0").rstrip(".")
+    if n < 1000:
+        return f"{n:.4f}".rstrip("0").rstrip(".")
+    return f"{n:,.2f}"
 
 def fmt_usd(x):
-    try:
-        n = float(x or 0)
-        return f"${n:,.2f}"
-    except Exception:
-        return f"${x}"
+    return f"${float(x or 0):,.2f}"
 
 def short_wallet(addr: str) -> str:
     if not addr or len(addr) < 8:
@@ -139,9 +191,33 @@ def short_mint(mint: str) -> str:
     return mint[:4] + "…" + mint[-4:]
 
 # ---------- SELL TRACKER STATE ----------
-pending_sell_media = {}    # chat_id -> mint (awaiting image)
-sell_last_seen = {}        # mint -> last tx sig processed
+pending_sell_media = {}    # chat_id -> (mint, monotonic ts) awaiting image
+PENDING_MEDIA_TTL = 300    # seconds before an unanswered image prompt is dropped
+sell_last_seen = {}        # mint -> last tx sig processed (tracked mints only)
 DEFAULT_WHALE_USD = 1000.0 # fallback threshold if none set per token
+SELL_SKULLS = "💀" * 14
+_SELL_ALERT = (
+    "{symbol} [{symbol}] 💀Sell!\n\n"
+    + SELL_SKULLS + "\n\n"
+    "💀| {usd}\n"
+    "💀| Sold: {amount} {symbol}\n"
+    "💀| Seller | Txn\n"
+    "💀| Market Cap: {mcap}\n"
+).format
+SELL_TWITTER_URL = "https://x.com/sentrip_bot"
+SOLSCAN_TX_URL = "https://solscan.io/tx/"
+SOLSCAN_ACCOUNT_URL = "https://solscan.io/account/"
+
+@lru_cache(maxsize=1024)
+def _mint_buttons(mint: str) -> tuple:
+    """Static first button row for a mint (Telegram objects are immutable, so safe to share)."""
+    return (
+        InlineKeyboardButton("🐴 Buy", url=f"https://jup.ag/swap/SOL-{mint}"),
+        InlineKeyboardButton("💀 DexS", url=f"https://dexscreener.com/solana/{mint}"),
+        InlineKeyboardButton("💀 Twitter", url=SELL_TWITTER_URL),
+    )
+SELL_SIG_LIMIT = 20  # max new signatures drained per mint per tick
+SELL_POLL_CONCURRENCY = int(os.getenv("SELL_POLL_CONCURRENCY", "8"))  # chats alerted in parallel per tick
 
 # ---------- COMMANDS ----------
 async def sell_track(update: Update, context: ContextTypes.DEFAULT_TYPE):
@@ -165,19 +241,25 @@ async def sell_track(update: Update, context: ContextTypes.DEFAULT_TYPE):
         return
 
     # ACK immediately
-    pending_sell_media[chat_id] = mint
-    sell_add_token(chat_id, mint, None, None, None)
+    pending_sell_media[chat_id] = (mint, time.monotonic())
+    await sell_add_token(chat_id, mint, None, None, None)
     await update.message.reply_text(f"✅ Sell-tracking {mint} (TOKEN). Send an image now or /sell_skip.")
 
     # Enrich symbol in the background
     try:
         symbol = await best_symbol_for_mint(mint)
         if symbol:
-            sell_update_symbol(mint, symbol)
+            await sell_update_symbol(mint, symbol)
     except Exception as e:
         logging.error(f"sell_track: symbol lookup failed for {mint}: {e}")
 
+def _expire_pending_media():
+    cutoff = time.monotonic() - PENDING_MEDIA_TTL
+    for chat_id in [c for c, (_mint, ts) in pending_sell_media.items() if ts < cutoff]:
+        del pending_sell_media[chat_id]
+
 async def sell_skip(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    _expire_pending_media()
     chat_id = update.effective_chat.id
     if chat_id in pending_sell_media:
         del pending_sell_media[chat_id]
@@ -186,17 +268,18 @@ async def sell_skip(update: Update, context: ContextTypes.DEFAULT_TYPE):
         await update.message.reply_text("❌ No pending token for sell tracker.")
 
 async def sell_handle_media(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    _expire_pending_media()
     chat_id = update.effective_chat.id
     if chat_id not in pending_sell_media:
         return
-    mint = pending_sell_media.pop(chat_id)
+    mint, _ts = pending_sell_media.pop(chat_id)
     if update.message.photo:
         file_id = update.message.photo[-1].file_id
     elif update.message.document:
         file_id = update.message.document.file_id
     else:
         return
-    sell_add_token(chat_id, mint, file_id, None, None)
+    await sell_add_token(chat_id, mint, file_id, None, None)
     await update.message.reply_text(f"📸 Media saved for sell tracker: {mint}.")
 
 async def sell_untrack(update: Update, context: ContextTypes.DEFAULT_TYPE):
@@ -205,7 +288,7 @@ async def sell_untrack(update: Update, context: ContextTypes.DEFAULT_TYPE):
         return
     mint = context.args[0].strip()
     chat_id = update.effective_chat.id
-    sell_remove_token(chat_id, mint)
+    await sell_remove_token(chat_id, mint)
     await update.message.reply_text(f"🗑 Stopped sell-tracking {mint}.")
 
 async def sell_list(update: Update, context: ContextTypes.DEFAULT_TYPE):
@@ -219,7 +302,7 @@ async def sell_list(update: Update, context: ContextTypes.DEFAULT_TYPE):
         if not symbol:
             symbol = await best_symbol_for_mint(mint)
             if symbol:
-                sell_update_symbol(mint, symbol)
+                await sell_update_symbol(mint, symbol)
         enriched.append((symbol or "TOKEN", mint, thr))
 
     enriched.sort(key=lambda t: t[0].upper())
@@ -249,120 +332,236 @@ async def sell_setthreshold(update: Update, context: ContextTypes.DEFAULT_TYPE):
         await update.message.reply_text("❌ Invalid USD amount.")
         return
     chat_id = update.effective_chat.id
-    sell_update_threshold(chat_id, mint, usd)
+    await sell_update_threshold(chat_id, mint, usd)
     await update.message.reply_text(f"✅ Whale threshold for {short_mint(mint)} set to {fmt_usd(usd)}.")
 
+# ---------- HTTP ----------
+# One pooled HTTP/2 client for Helius and the price APIs: batched and concurrent calls
+# to the same host share a single multiplexed TLS connection, kept warm across ticks.
+_client = None
+# Price APIs return large JSON that compresses well; "br" needs Brotli (httpx[brotli])
+_CLIENT_HEADERS = {"Accept": "application/json", "Accept-Encoding": "gzip, deflate, br"}
+
+def _get_client() -> httpx.AsyncClient:
+    global _client
+    if _client is None or _client.is_closed:
+        _client = httpx.AsyncClient(
+            http2=True,
+            limits=httpx.Limits(max_connections=100, max_keepalive_connections=32, keepalive_expiry=75),
+            timeout=httpx.Timeout(20.0, connect=10.0),
+            headers=_CLIENT_HEADERS,
+        )
+    return _client
+
+async def _close_client():
+    if _client is not None and not _client.is_closed:
+        await _client.aclose()
+
+HTTP_RETRIES = 2  # extra attempts for 429/5xx/network errors; other 4xx are final (Helius RPC)
+# Price APIs are best-effort with fallbacks behind them: one short attempt each, no retries
+PRICE_HTTP_TIMEOUT = httpx.Timeout(3.0, connect=1.0)
+
+def _rpc_backoff_delay(attempt: int, retry_after=None) -> float:
+    """Patient backoff for Helius RPC: 2^attempt s up to 8s, or Retry-After as given."""
+    try:
+        delay = float(retry_after) if retry_after else min(8, 2 ** attempt)
+    except ValueError:  # HTTP-date form
+        delay = min(8, 2 ** attempt)
+    return delay + random.random() * 0.25
+
+_JSON_HEADERS = {"Content-Type": "application/json"}
+
+async def _request_json(method: str, url: str, body=None, retries: int = HTTP_RETRIES, timeout=None):
+    """
+    JSON body of a 200 response, or None once retries are exhausted / on a permanent error.
+    body is sent as JSON; both directions go through orjson. timeout overrides the client default.
+    """
+    client = _get_client()
+    kwargs = {} if body is None else {"content": orjson.dumps(body), "headers": _JSON_HEADERS}
+    if timeout is not None:
+        kwargs["timeout"] = timeout
+    for attempt in range(retries + 1):
+        retry_after = None
+        try:
+            resp = await client.request(method, url, **kwargs)
+            if resp.status_code == 200:
+                try:
+                    return orjson.loads(resp.content)
+                except orjson.JSONDecodeError:
+                    return None
+            if resp.status_code == 429:
+                retry_after = resp.headers.get("Retry-After")
+            elif resp.status_code < 500:
+                return None
+        except httpx.TransportError as e:
+            if attempt == retries and retries:  # single-shot callers fall through quietly
+                logging.error(f"{method} {url.split('?')[0]} failed: {e!r}")
+        if attempt < retries:
+            await asyncio.sleep(_rpc_backoff_delay(attempt, retry_after))
+    return None
+
+async def _price_json(url: str):
+    return await _request_json("GET", url, retries=0, timeout=PRICE_HTTP_TIMEOUT)
+
+_inflight = {}  # single_flight registry for this module: key -> asyncio.Task
+
 # ---------- RPC ----------
-async def fetch_transactions(mint: str, limit: int = 5):
-    payload = {
-        "jsonrpc": "2.0",
-        "id": "tx_fetch",
-        "method": "getSignaturesForAddress",
-        "params": [mint, {"limit": limit}],
-    }
-    async with aiohttp.ClientSession() as session:
-        async with session.post(HELIUS_URL, json=payload) as resp:
-            data = await resp.json()
-            return data.get("result", [])
+RPC_BATCH_MAX = 20  # calls per JSON-RPC batch POST; bigger sets are split
+
+async def _rpc_call(method: str, params, rid=1):
+    payload = {"jsonrpc": "2.0", "id": rid, "method": method, "params": params}
+    data = await _request_json("POST", HELIUS_URL, payload)
+    return (data or {}).get("result")
+
+async def _rpc_batch(method: str, params_list):
+    """
+    Same method over many params in as few POSTs as possible.
+    Results come back in input order (None where a call failed).
+    """
+    results = [None] * len(params_list)
+    for start in range(0, len(params_list), RPC_BATCH_MAX):
+        chunk = params_list[start:start + RPC_BATCH_MAX]
+        payload = [
+            {"jsonrpc": "2.0", "id": start + i, "method": method, "params": params}
+            for i, params in enumerate(chunk)
+        ]
+        data = await _request_json("POST", HELIUS_URL, payload)
+        if isinstance(data, list):
+            for r in data:
+                rid = r.get("id")
+                if isinstance(rid, int) and 0 <= rid < len(results):
+                    results[rid] = r.get("result")
+        elif data is not None:
+            # provider refused the batch: fall back to concurrent single calls
+            single = await asyncio.gather(
+                *(_rpc_call(method, params, start + i) for i, params in enumerate(chunk)),
+                return_exceptions=True,
+            )
+            for i, r in enumerate(single):
+                if not isinstance(r, Exception):
+                    results[start + i] = r
+    return results
+
+async def fetch_transactions_batch(mints, limit: int = 5, until=None):
+    """
+    mint -> recent signatures for every mint, batched.
+    until: optional {mint: signature} cursor; only newer signatures are returned (often none).
+    """
+    params_list = []
+    for m in mints:
+        opts = {"limit": limit}
+        if until and until.get(m):
+            opts["until"] = until[m]
+        params_list.append([m, opts])
+    results = await _rpc_batch("getSignaturesForAddress", params_list)
+    return {m: r or [] for m, r in zip(mints, results)}
+
+# Only meta.pre/postTokenBalances are read, and those are identical in plain "json"
+# encoding; "jsonParsed" would also expand every instruction. Version 0 is required
+# or the RPC rejects versioned (address-table) transactions outright.
+_TX_OPTS = {"encoding": "json", "commitment": "confirmed", "maxSupportedTransactionVersion": 0}
 
 async def get_transaction(signature: str):
-    payload = {
-        "jsonrpc": "2.0",
-        "id": "tx_parse",
-        "method": "getTransaction",
-        "params": [signature, {"encoding": "jsonParsed"}],
-    }
-    async with aiohttp.ClientSession() as session:
-        async with session.post(HELIUS_URL, json=payload) as resp:
-            data = await resp.json()
-            return data.get("result")
+    return await single_flight(
+        _inflight,
+        ("tx", signature),
+        lambda: _rpc_call("getTransaction", [signature, _TX_OPTS], "tx_parse"),
+    )
+
+async def get_transactions_batch(signatures):
+    """signature -> parsed transaction (or None), batched."""
+    results = await _rpc_batch("getTransaction", [[s, _TX_OPTS] for s in signatures])
+    return dict(zip(signatures, results))
 
 # ---------- SELL PARSER ----------
-async def parse_sell(signature: str, mint: str):
+def sell_from_tx(tx, mint: str):
     """
-    Detect net decrease of token balance for a holder (i.e., a sell).
+    Detect net decrease of token balance for a holder (i.e., a sell) in a fetched transaction.
     Returns {"seller": <address>, "amount": tokens_sold, "decimals": d} or None.
     """
-    tx = await get_transaction(signature)
     if not tx:
         return None
 
-    meta = tx.get("meta", {}) or {}
-    pre = meta.get("preTokenBalances", []) or []
-    post = meta.get("postTokenBalances", []) or []
-
-    def amt(tb):
-        u = tb.get("uiTokenAmount", {}) or {}
-        return int(u.get("amount", 0) or 0), int(u.get("decimals", 0) or 0)
-
-    pre_map = {}
-    for b in pre:
-        if b.get("mint") == mint:
-            a, d = amt(b)
-            pre_map[(b.get("owner"), mint)] = (a, d)
-
-    for b in post:
+    meta = tx.get("meta") or {}
+    pre_map = {  # owner -> raw amount before the tx
+        b.get("owner"): int((b.get("uiTokenAmount") or {}).get("amount", 0) or 0)
+        for b in meta.get("preTokenBalances") or ()
+        if b.get("mint") == mint
+    }
+    for b in meta.get("postTokenBalances") or ():
         if b.get("mint") != mint:
             continue
-        a_post, dec = amt(b)
-        a_pre, _ = pre_map.get((b.get("owner"), mint), (0, dec))
-        delta = a_post - a_pre
+        u = b.get("uiTokenAmount") or {}
+        owner = b.get("owner")
+        delta = int(u.get("amount", 0) or 0) - pre_map.get(owner, 0)
         if delta < 0:  # net decrease -> sold
-            tokens = (-delta) / (10 ** max(dec, 0))
-            return {"seller": b.get("owner"), "amount": tokens, "decimals": dec}
+            dec = int(u.get("decimals", 0) or 0)
+            return {"seller": owner, "amount": -delta / (10 ** max(dec, 0)), "decimals": dec}
     return None
 
 # ---------- TOKEN INFO ----------
+TOKEN_INFO_TTL = 45  # seconds; price/mc drift inside one poll window is irrelevant for alerts
+_info_cache = {}     # mint -> (monotonic ts, info)
+
 async def fetch_token_info(mint: str):
-    # 1) Pump.fun (best effort)
-    try:
-        async with aiohttp.ClientSession() as session:
-            async with session.get(PUMPFUN_URL.format(mint)) as resp:
-                if resp.status == 200:
-                    data = await resp.json()
-                    d = data.get("data") or {}
-                    if d:
-                        return {
-                            "symbol": d.get("symbol", "TOKEN"),
-                            "price": float(d.get("price", 0) or 0),
-                            "mc": float(d.get("marketCap", 0) or 0),
-                        }
-    except Exception:
-        pass
+    hit = _info_cache.get(mint)
+    if hit and time.monotonic() - hit[0] < TOKEN_INFO_TTL:
+        return hit[1]
+    info = await single_flight(_inflight, ("info", mint), lambda: _fetch_token_info_uncached(mint))
+    if info is not None:
+        _info_cache[mint] = (time.monotonic(), info)
+        return info
+    return {"symbol": "TOKEN", "price": 0, "mc": 0}
 
-    # 2) DexScreener (prefer FDV as MC proxy)
-    try:
-        async with aiohttp.ClientSession() as session:
-            async with session.get(DEXSCREENER_URL.format(mint)) as resp:
-                if resp.status == 200:
-                    data = await resp.json()
-                    pairs = data.get("pairs", []) or []
-                    if pairs:
-                        pair = pairs[0]
-                        return {
-                            "symbol": (pair.get("baseToken") or {}).get("symbol", "TOKEN"),
-                            "price": float(pair.get("priceUsd", 0) or 0),
-                            "mc": float(pair.get("fdv", 0) or 0),
-                        }
-    except Exception:
-        pass
+async def _info_pumpfun(mint: str):
+    data = await _price_json(PUMPFUN_URL.format(mint))
+    if not data:
+        return None
+    d = data.get("data") or {}
+    if not d:
+        return None
+    return {
+        "symbol": d.get("symbol", "TOKEN"),
+        "price": float(d.get("price", 0) or 0),
+        "mc": float(d.get("marketCap", 0) or 0),
+    }
 
-    # 3) CoinGecko
-    try:
-        async with aiohttp.ClientSession() as session:
-            async with session.get(COINGECKO_URL.format(mint)) as resp:
-                if resp.status == 200:
-                    data = await resp.json()
-                    md = data.get("market_data") or {}
-                    return {
-                        "symbol": (data.get("symbol") or "TOKEN").upper(),
-                        "price": float(((md.get("current_price") or {}).get("usd", 0)) or 0),
-                        "mc": float(((md.get("market_cap") or {}).get("usd", 0)) or 0),
-                    }
-    except Exception:
-        pass
+async def _info_dexscreener(mint: str):
+    # prefer FDV as MC proxy
+    data = await _price_json(DEXSCREENER_URL.format(mint))
+    if not data:
+        return None
+    pairs = data.get("pairs", []) or []
+    if not pairs:
+        return None
+    pair = pairs[0]
+    return {
+        "symbol": (pair.get("baseToken") or {}).get("symbol", "TOKEN"),
+        "price": float(pair.get("priceUsd", 0) or 0),
+        "mc": float(pair.get("fdv", 0) or 0),
+    }
 
-    return {"symbol": "TOKEN", "price": 0, "mc": 0}
+async def _info_coingecko(mint: str):
+    data = await _price_json(COINGECKO_URL.format(mint))
+    if not data:
+        return None
+    md = data.get("market_data") or {}
+    return {
+        "symbol": (data.get("symbol") or "TOKEN").upper(),
+        "price": float(((md.get("current_price") or {}).get("usd", 0)) or 0),
+        "mc": float(((md.get("market_cap") or {}).get("usd", 0)) or 0),
+    }
+
+_INFO_SOURCES = (_info_pumpfun, _info_dexscreener, _info_coingecko)  # priority order
+
+INFO_PRIORITY_GRACE_SEC = 1.5  # how long a higher-priority source may keep an answer in hand waiting
+
+async def _fetch_token_info_uncached(mint: str):
+    """
+    Query every source at once and prefer answers in priority order; a lower-priority answer
+    is used as soon as the sources above it fail, or after a short grace. None if all failed.
+    """
+    return await first_by_priority((source(mint) for source in _INFO_SOURCES), INFO_PRIORITY_GRACE_SEC)
 
 async def best_symbol_for_mint(mint: str):
     try:
@@ -373,90 +572,282 @@ async def best_symbol_for_mint(mint: str):
         return None
 
 # ---------- POLLING ----------
-async def poll_sells(context: ContextTypes.DEFAULT_TYPE):
-    conn = sqlite3.connect(DB_PATH)
-    c = conn.cursor()
-    c.execute("SELECT chat_id, mint, media_file_id, symbol, usd_threshold FROM sell_tracked")
-    rows = c.fetchall()
-    conn.close()
-
-    for chat_id, mint, media_file_id, symbol, usd_threshold in rows:
-        if is_native_sol(mint):
-            continue
+async def _poll_one(bot, row, sells, sem: asyncio.Semaphore):
+    """Alert one chat about a mint's new sells (oldest first) that clear the whale threshold."""
+    chat_id, mint, media_file_id, symbol, usd_threshold = row
+    async with sem:
+        # one (cached) lookup covers both the price and a missing stored symbol
+        info = await fetch_token_info(mint)
+        if not symbol:
+            symbol = (info.get("symbol") or "").strip()
+            if symbol and symbol != "TOKEN":
+                await sell_update_symbol(mint, symbol)
+        disp_symbol = symbol or "TOKEN"
+        price = float(info.get("price", 0) or 0)
+        mcap = float(info.get("mc", 0) or 0)
+        threshold = float(usd_threshold) if usd_threshold and usd_threshold > 0 else DEFAULT_WHALE_USD
+
+        for sig, details in sells:
+            await _alert_sell(bot, chat_id, mint, media_file_id, sig, details,
+                              disp_symbol, price, mcap, threshold)
+
+async def _alert_sell(bot, chat_id, mint, media_file_id, sig, details, disp_symbol, price, mcap, threshold):
+    amount = float(details.get("amount", 0) or 0)
+    seller = details.get("seller")
+    usd_value = amount * price if price else 0.0
+
+    # Whale gating (only alert if >= threshold)
+    if usd_value < threshold:
+        return
 
-        try:
-            txs = await fetch_transactions(mint, limit=5)
-            if not txs:
-                continue
+    # Styled alert (sell)
+    tx_url = SOLSCAN_TX_URL + sig
+    text = _SELL_ALERT(symbol=disp_symbol, usd=fmt_usd(usd_value), amount=fmt_amount(amount), mcap=fmt_usd(mcap))
 
-            sig = txs[0].get("signature")
-            if not sig or sell_last_seen.get(mint) == sig:
-                continue
-            sell_last_seen[mint] = sig
+    # Buttons: the per-mint row is cached, only seller/tx vary per alert
+    seller_url = SOLSCAN_ACCOUNT_URL + seller if seller else tx_url
+    markup = InlineKeyboardMarkup((
+        _mint_buttons(mint),
+        (InlineKeyboardButton("Seller", url=seller_url), InlineKeyboardButton("Txn", url=tx_url)),
+    ))
 
-            if not symbol:
-                symbol = await best_symbol_for_mint(mint)
-                if symbol:
-                    sell_update_symbol(mint, symbol)
+    if media_file_id:
+        await bot.send_photo(chat_id, photo=media_file_id, caption=text, reply_markup=markup)
+    else:
+        await bot.send_message(chat_id, text, reply_markup=markup)
 
-            info = await fetch_token_info(mint)
-            disp_symbol = symbol or info.get("symbol", "TOKEN")
-            price = float(info.get("price", 0) or 0)
-            mcap = float(info.get("mc", 0) or 0)
+async def poll_sells(context: ContextTypes.DEFAULT_TYPE):
+    # while the live feed is up this is only a backstop for sells it missed, so run it rarely
+    global _last_full_poll
+    now = time.monotonic()
+    if _ws_live() and now - _last_full_poll < SELL_WS_BACKSTOP_SEC:
+        return
+    _last_full_poll = now
 
-            details = await parse_sell(sig, mint)
-            if not details:
-                continue
+    rows = [(chat_id, mint, *vals) for (chat_id, mint), vals in _sell_rows.items()]
 
-            amount = float(details.get("amount", 0) or 0)
-            seller = details.get("seller") or "?"
-            usd_value = amount * price if price else 0.0
+    mints = list(dict.fromkeys(row[1] for row in rows))
+    if not mints:
+        return
 
-            # Whale gating (only alert if >= threshold)
-            threshold = float(usd_threshold) if usd_threshold and usd_threshold > 0 else DEFAULT_WHALE_USD
-            if usd_value < threshold:
+    # One batched signature lookup for every tracked mint, then one for the new txs
+    try:
+        sigs_by_mint = await fetch_transactions_batch(mints, limit=SELL_SIG_LIMIT, until=sell_last_seen)
+        fresh = {}  # mint -> unseen successful signatures, oldest first
+        for mint, txs in sigs_by_mint.items():
+            if not txs:
                 continue
-
-            # Styled alert (sell)
-            skulls = "💀" * 14
-            title = f"{disp_symbol} [{disp_symbol}] 💀Sell!"
-            tx_url = f"https://solscan.io/tx/{sig}"
-
-            text = (
-                f"{title}\n\n"
-                f"{skulls}\n\n"
-                f"💀| {fmt_usd(usd_value)}\n"
-                f"💀| Sold: {fmt_amount(amount)} {disp_symbol}\n"
-                f"💀| Seller | Txn\n"
-                f"💀| Market Cap: {fmt_usd(mcap)}\n"
-            )
-
-            # Buttons
-            jup = f"https://jup.ag/swap/SOL-{mint}"
-            dexs = f"https://dexscreener.com/solana/{mint}"
-            twitter = "https://x.com/sentrip_bot"
-            seller_url = f"https://solscan.io/account/{seller}" if seller else tx_url
-
-            buttons = [
-                [
-                    InlineKeyboardButton("🐴 Buy", url=jup),
-                    InlineKeyboardButton("💀 DexS", url=dexs),
-                    InlineKeyboardButton("💀 Twitter", url=twitter),
-                ],
-                [
-                    InlineKeyboardButton("Seller", url=seller_url),
-                    InlineKeyboardButton("Txn", url=tx_url),
-                ],
+            # first sight of a mint: start from its newest tx instead of replaying history
+            batch = txs if mint in sell_last_seen else txs[:1]
+            sell_last_seen[mint] = txs[0].get("signature")
+            sigs = [
+                t.get("signature") for t in reversed(batch)
+                if t.get("signature") and not t.get("err") and _claim_sig(t.get("signature"))
             ]
-            markup = InlineKeyboardMarkup(buttons)
+            if sigs:
+                fresh[mint] = sigs
+        advanced = {m: sell_last_seen[m] for m, txs in sigs_by_mint.items() if txs}
+        if advanced:
+            await sell_save_last_seen(advanced)
+        if not fresh:
+            return
+        txs_by_sig = await get_transactions_batch([sig for sigs in fresh.values() for sig in sigs])
+    except Exception as e:
+        logging.error(f"Error polling sells: {e}")
+        return
 
-            if media_file_id:
-                await context.bot.send_photo(chat_id, photo=media_file_id, caption=text, reply_markup=markup)
-            else:
-                await context.bot.send_message(chat_id, text, reply_markup=markup)
+    # parse each tx once per mint; mints with no actual sell skip the price lookup entirely
+    sells_by_mint = {}
+    for mint, sigs in fresh.items():
+        details = ((sig, sell_from_tx(txs_by_sig.get(sig), mint)) for sig in sigs)
+        sells = [(sig, d) for sig, d in details if d]
+        if sells:
+            sells_by_mint[mint] = sells
+
+    sem = asyncio.Semaphore(SELL_POLL_CONCURRENCY)
+    work = [row for row in rows if row[1] in sells_by_mint]
+    results = await asyncio.gather(
+        *(_poll_one(context.bot, row, sells_by_mint[row[1]], sem) for row in work),
+        return_exceptions=True,
+    )
+    for row, res in zip(work, results):
+        if isinstance(res, Exception):
+            logging.error(f"Error polling sells for {row[1]}: {res}")
+
+# ---------- LIVE SELLS (WS) ----------
+# One Helius socket with a logsSubscribe per tracked mint pushes new signatures as they land;
+# poll_sells drops to a slow backstop while it is connected.
+SELL_WS_BACKSTOP_SEC = 300
+SELL_WS_TX_RETRY_DELAYS = (0, 1, 3)  # a just-confirmed tx can briefly be missing from getTransaction
+SELL_HANDLED_MAX = 4096
+SELL_WS_CURSOR_FLUSH_SEC = 2  # socket-claimed cursors are persisted in one batch this long after the first
+
+_ws = None                 # live aiohttp websocket, None while disconnected
+_ws_task = None            # the connection loop
+_ws_wake = asyncio.Event() # set whenever the tracked mint set changes
+_ws_subs = {}              # mint -> subscription id (None while the subscribe is in flight)
+_ws_sub_mints = {}         # subscription id -> mint
+_ws_pending = {}           # request id -> mint awaiting its subscription id
+_ws_next_id = 0
+_last_full_poll = 0.0
+_handled_sigs = OrderedDict()  # recently alerted signatures, shared by the socket and the poller (LRU)
+_ws_cursors = {}           # mint -> newest socket-claimed signature not yet written to last_sig
+_ws_flush_task = None
+
+def _ws_live() -> bool:
+    return _ws is not None and not _ws.closed
+
+def _claim_sig(sig: str) -> bool:
+    """True the first time a signature is seen, so the socket and the poller never both alert it."""
+    if sig in _handled_sigs:
+        return False
+    _handled_sigs[sig] = None
+    if len(_handled_sigs) > SELL_HANDLED_MAX:
+        _handled_sigs.popitem(last=False)
+    return True
+
+async def _ws_sync(ws):
+    """Subscribe newly tracked mints and drop untracked ones, in one batch frame."""
+    global _ws_next_id
+    want = {m for _chat_id, m in _sell_rows}
+    batch = []
+    for mint in want - _ws_subs.keys():
+        _ws_next_id += 1
+        _ws_pending[_ws_next_id] = mint
+        _ws_subs[mint] = None
+        batch.append({
+            "jsonrpc": "2.0", "id": _ws_next_id, "method": "logsSubscribe",
+            "params": [{"mentions": [mint]}, {"commitment": "confirmed"}],
+        })
+    for mint in _ws_subs.keys() - want:
+        sub_id = _ws_subs.pop(mint)
+        if sub_id is not None:
+            _ws_sub_mints.pop(sub_id, None)
+            _ws_next_id += 1
+            batch.append({"jsonrpc": "2.0", "id": _ws_next_id, "method": "logsUnsubscribe", "params": [sub_id]})
+    if batch:
+        await ws.send_str(orjson.dumps(batch).decode())
+
+async def _ws_syncer(ws):
+    while True:
+        await _ws_wake.wait()
+        _ws_wake.clear()
+        await _ws_sync(ws)
+
+def _ws_on_message(bot, msg: dict):
+    rid = msg.get("id")
+    if rid in _ws_pending:
+        mint = _ws_pending.pop(rid)
+        sub_id = msg.get("result")
+        if isinstance(sub_id, int) and mint in _ws_subs:
+            _ws_subs[mint] = sub_id
+            _ws_sub_mints[sub_id] = mint
+        else:
+            # refused, or untracked meanwhile: forget it and let the next sync decide
+            _ws_subs.pop(mint, None)
+            if isinstance(sub_id, int):
+                spawn(_ws.send_str(orjson.dumps(
+                    {"jsonrpc": "2.0", "id": 0, "method": "logsUnsubscribe", "params": [sub_id]}
+                ).decode()))
+        return
+    if msg.get("method") != "logsNotification":
+        return
+    params = msg.get("params") or {}
+    mint = _ws_sub_mints.get(params.get("subscription"))
+    value = (params.get("result") or {}).get("value") or {}
+    sig = value.get("signature")
+    if mint and sig and not value.get("err"):
+        spawn(_ws_handle_sig(bot, mint, sig))
+
+async def _ws_handle_sig(bot, mint: str, sig: str):
+    try:
+        if sig in _handled_sigs:
+            return
+        tx = None
+        for delay in SELL_WS_TX_RETRY_DELAYS:
+            await asyncio.sleep(delay)
+            tx = await get_transaction(sig)
+            if tx:
+                break
+        # unfetchable txs stay unclaimed so the backstop poll can still pick them up
+        if not tx or not _claim_sig(sig):
+            return
+        _ws_advance(mint, sig)
+        details = sell_from_tx(tx, mint)
+        if not details:
+            return
+        rows = [(chat_id, m, *vals) for (chat_id, m), vals in _sell_rows.items() if m == mint]
+        sem = asyncio.Semaphore(SELL_POLL_CONCURRENCY)
+        results = await asyncio.gather(*(_poll_one(bot, row, [(sig, details)], sem) for row in rows), return_exceptions=True)
+        for res in results:
+            if isinstance(res, Exception):
+                logging.error(f"Live sell alert failed for {mint}: {res}")
+    except Exception as e:
+        logging.error(f"Live sell handling failed for {sig}: {e}")
+
+def _ws_advance(mint: str, sig: str):
+    """Move the mint's cursor to a socket-claimed signature; persisted shortly after so a restart doesn't re-alert it."""
+    global _ws_flush_task
+    if not any(m == mint for _chat_id, m in _sell_rows):
+        return  # untracked meanwhile
+    sell_last_seen[mint] = sig
+    _ws_cursors[mint] = sig
+    if _ws_flush_task is None or _ws_flush_task.done():
+        _ws_flush_task = spawn(_ws_flush_cursors(SELL_WS_CURSOR_FLUSH_SEC))
+
+async def _ws_flush_cursors(delay: float = 0):
+    await asyncio.sleep(delay)
+    if not _ws_cursors:
+        return
+    batch = dict(_ws_cursors)
+    _ws_cursors.clear()
+    try:
+        await sell_save_last_seen(batch)
+    except Exception as e:
+        logging.error(f"Saving sell cursors failed: {e}")
 
-        except Exception as e:
-            logging.error(f"Error polling sells for {mint}: {e}")
+async def _ws_run(bot):
+    global _ws, _last_full_poll
+    delay = 2
+    async with aiohttp.ClientSession() as session:
+        while True:
+            syncer = None
+            try:
+                async with session.ws_connect(HELIUS_WS_URL, heartbeat=20) as ws:
+                    _ws = ws
+                    delay = 2
+                    # fresh socket: every subscription has to be made again
+                    _ws_subs.clear()
+                    _ws_sub_mints.clear()
+                    _ws_pending.clear()
+                    _ws_wake.set()
+                    syncer = spawn(_ws_syncer(ws))
+                    async for frame in ws:
+                        if frame.type not in (aiohttp.WSMsgType.TEXT, aiohttp.WSMsgType.BINARY):
+                            break
+                        try:
+                            data = orjson.loads(frame.data)
+                        except orjson.JSONDecodeError:
+                            continue
+                        for msg in data if isinstance(data, list) else (data,):
+                            _ws_on_message(bot, msg)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logging.error(f"Sell WS error: {e}")
+            finally:
+                _ws = None
+                if syncer:
+                    syncer.cancel()
+            # the backstop poll covers the gap; catch up on the next tick
+            _last_full_poll = 0.0
+            await asyncio.sleep(delay + random.random())
+            delay = min(60, delay * 2)
+
+async def sell_ws_bootstrap(context: ContextTypes.DEFAULT_TYPE):
+    global _ws_task
+    if HELIUS_WS_URL and _ws_task is None:
+        _ws_task = spawn(_ws_run(context.bot))
 
 # ---------- REGISTER ----------
 def register_selltracker(app):
@@ -468,3 +859,20 @@ def register_selltracker(app):
     app.add_handler(CommandHandler("sellthreshold", sell_setthreshold))
     app.add_handler(MessageHandler(filters.PHOTO | filters.Document.ALL, sell_handle_media))
     app.job_queue.run_repeating(poll_sells, interval=30, first=5)
+    app.job_queue.run_once(sell_ws_bootstrap, when=2)
+
+    prev_shutdown = app.post_shutdown
+    async def _post_shutdown(application):
+        if prev_shutdown:
+            await prev_shutdown(application)
+        if _ws_task:
+            _ws_task.cancel()
+            try:
+                await _ws_task  # lets the socket's ClientSession close before the loop does
+            except asyncio.CancelledError:
+                pass
+        if _ws_flush_task:
+            _ws_flush_task.cancel()
+        await _ws_flush_cursors()
+        await _close_client()
+    app.post_shutdown = _post_shutdown
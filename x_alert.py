@@ -1,6 +1,8 @@
 # x_alert.py
 import os
 import sqlite3
+import asyncio
+import threading
 import logging
 import aiohttp
 from typing import Optional, Tuple, List, Dict
@@ -25,72 +27,101 @@ DB_PATH = "tracked_tokens.db"
 logging.basicConfig(level=logging.INFO)
 
 # ========= DB =========
+# One shared autocommit connection in WAL mode; the lock serialises use across threads.
+_db: Optional[sqlite3.Connection] = None
+_db_lock = threading.Lock()
+
+def _conn() -> sqlite3.Connection:
+    global _db
+    if _db is None:
+        _db = sqlite3.connect(DB_PATH, check_same_thread=False, isolation_level=None)
+        _db.execute("PRAGMA journal_mode=WAL")
+        _db.execute("PRAGMA synchronous=NORMAL")
+        _db.execute("PRAGMA temp_store=MEMORY")
+        _db.execute("PRAGMA busy_timeout=5000")
+    return _db
+
 def init_x_db():
-    conn = sqlite3.connect(DB_PATH)
-    c = conn.cursor()
-    c.execute("""
-        CREATE TABLE IF NOT EXISTS x_accounts (
-            chat_id INTEGER,
-            handle TEXT,        -- lowercase without @
-            user_id TEXT,       -- X user id
-            display TEXT,       -- cached name/display
-            PRIMARY KEY (chat_id, handle)
-        )
-    """)
-    c.execute("""
-        CREATE TABLE IF NOT EXISTS x_followers (
-            user_id TEXT,       -- tracked account's X user id
-            follower_id TEXT,   -- follower X user id
-            PRIMARY KEY (user_id, follower_id)
-        )
-    """)
-    conn.commit()
-    conn.close()
+    with _db_lock:
+        c = _conn()
+        c.execute("""
+            CREATE TABLE IF NOT EXISTS x_accounts (
+                chat_id INTEGER,
+                handle TEXT,        -- lowercase without @
+                user_id TEXT,       -- X user id
+                display TEXT,       -- cached name/display
+                PRIMARY KEY (chat_id, handle)
+            )
+        """)
+        c.execute("""
+            CREATE TABLE IF NOT EXISTS x_followers (
+                user_id TEXT,       -- tracked account's X user id
+                follower_id TEXT,   -- follower X user id
+                PRIMARY KEY (user_id, follower_id)
+            )
+        """)
 
 def x_add_account(chat_id: int, handle: str, user_id: str, display: Optional[str]):
-    conn = sqlite3.connect(DB_PATH)
-    c = conn.cursor()
-    c.execute(
-        "INSERT OR REPLACE INTO x_accounts (chat_id, handle, user_id, display) VALUES (?, ?, ?, ?)",
-        (chat_id, handle.lower(), user_id, display),
-    )
-    conn.commit()
-    conn.close()
+    with _db_lock:
+        _conn().execute(
+            "INSERT INTO x_accounts (chat_id, handle, user_id, display) VALUES (?, ?, ?, ?) "
+            "ON CONFLICT(chat_id, handle) DO UPDATE SET user_id=excluded.user_id, display=excluded.display",
+            (chat_id, handle.lower(), user_id, display),
+        )
 
 def x_remove_account(chat_id: int, handle: str):
-    conn = sqlite3.connect(DB_PATH)
-    c = conn.cursor()
-    # also clear follower cache for this account
-    c.execute("SELECT user_id FROM x_accounts WHERE chat_id=? AND handle=?", (chat_id, handle.lower()))
-    row = c.fetchone()
-    if row:
-        c.execute("DELETE FROM x_followers WHERE user_id=?", (row[0],))
-    c.execute("DELETE FROM x_accounts WHERE chat_id=? AND handle=?", (chat_id, handle.lower()))
-    conn.commit()
-    conn.close()
+    with _db_lock:
+        c = _conn()
+        c.execute("BEGIN")
+        try:
+            # also clear follower cache for this account
+            row = c.execute(
+                "SELECT user_id FROM x_accounts WHERE chat_id=? AND handle=?", (chat_id, handle.lower())
+            ).fetchone()
+            if row:
+                c.execute("DELETE FROM x_followers WHERE user_id=?", (row[0],))
+            c.execute("DELETE FROM x_accounts WHERE chat_id=? AND handle=?", (chat_id, handle.lower()))
+            c.execute("COMMIT")
+        except Exception:
+            c.execute("ROLLBACK")
+            raise
 
 def x_list_accounts(chat_id: int) -> List[Tuple[str, str, str]]:
-    conn = sqlite3.connect(DB_PATH)
-    c = conn.cursor()
-    c.execute("SELECT handle, user_id, display FROM x_accounts WHERE chat_id=?", (chat_id,))
-    rows = c.fetchall()
-    conn.close()
-    return rows
-
-def x_has_follower(tracked_user_id: str, follower_id: str) -> bool:
-    conn = sqlite3.connect(DB_PATH)
-    c = conn.cursor()
-    c.execute("SELECT 1 FROM x_followers WHERE user_id=? AND follower_id=?", (tracked_user_id, follower_id))
-    ok = c.fetchone() is not None
-    conn.close()
-    return ok
-
-def x_add_follower(tracked_user_id: str, follower_id: str):
-    conn = sqlite3.connect(DB_PATH)
-    c = conn.cursor()
-    c.execute("INSERT OR IGNORE INTO x_followers (user_id, follower_id) VALUES (?, ?)", (tracked_user_id, follower_id))
-    conn.commit()
-    conn.close()
+    with _db_lock:
+        return _conn().execute(
+            "SELECT handle, user_id, display FROM x_accounts WHERE chat_id=?", (chat_id,)
+        ).fetchall()
+
+def x_all_accounts() -> List[Tuple[int, str, str, str]]:
+    with _db_lock:
+        return _conn().execute("SELECT chat_id, handle, user_id, display FROM x_accounts").fetchall()
+
+def x_known_followers(tracked_user_id: str, follower_ids: List[str]) -> set:
+    """Subset of follower_ids already seen for this account, in one query."""
+    if not follower_ids:
+        return set()
+    marks = ",".join("?" * len(follower_ids))
+    with _db_lock:
+        rows = _conn().execute(
+            f"SELECT follower_id FROM x_followers WHERE user_id=? AND follower_id IN ({marks})",
+            (tracked_user_id, *follower_ids),
+        ).fetchall()
+    return {r[0] for r in rows}
+
+def x_add_followers(tracked_user_id: str, follower_ids: List[str]):
+    """Insert many follower ids in one transaction (one commit instead of one per row)."""
+    with _db_lock:
+        c = _conn()
+        c.execute("BEGIN")
+        try:
+            c.executemany(
+                "INSERT OR IGNORE INTO x_followers (user_id, follower_id) VALUES (?, ?)",
+                [(tracked_user_id, fid) for fid in follower_ids],
+            )
+            c.execute("COMMIT")
+        except Exception:
+            c.execute("ROLLBACK")
+            raise
 
 # ========= X API =========
 X_API_BASE = "https://api.twitter.com/2"
@@ -100,29 +131,46 @@ HEADERS = {
     "User-Agent": "Sentribot/1.0",
 }
 
+# One keep-alive session for every X API call (closed on shutdown)
+_http: Optional[aiohttp.ClientSession] = None
+
+async def _get_http() -> aiohttp.ClientSession:
+    global _http
+    if _http is None or _http.closed:
+        _http = aiohttp.ClientSession(
+            headers=HEADERS,
+            connector=aiohttp.TCPConnector(limit=100, limit_per_host=20, keepalive_timeout=75),
+            timeout=aiohttp.ClientTimeout(total=10),
+        )
+    return _http
+
+async def _close_http():
+    if _http is not None and not _http.closed:
+        await _http.close()
+
 async def _x_get_json(url: str, params: dict | None = None):
     """Return (json_or_none, error_text_or_none, status_code)."""
-    async with aiohttp.ClientSession() as s:
-        async with s.get(url, headers=HEADERS, params=params or {}) as r:
-            status = r.status
-            try:
-                data = await r.json()
-            except Exception:
-                txt = await r.text()
-                return None, f"HTTP {status}: {txt[:200]}", status
-            if status != 200:
-                err_msg = ""
-                if isinstance(data, dict) and "errors" in data:
-                    try:
-                        err_msg = "; ".join(
-                            f"{e.get('title','')}: {e.get('detail','')}" for e in data["errors"]
-                        )
-                    except Exception:
-                        err_msg = str(data)[:200]
-                if not err_msg:
+    s = await _get_http()
+    async with s.get(url, params=params or {}) as r:
+        status = r.status
+        try:
+            data = await r.json()
+        except Exception:
+            txt = await r.text()
+            return None, f"HTTP {status}: {txt[:200]}", status
+        if status != 200:
+            err_msg = ""
+            if isinstance(data, dict) and "errors" in data:
+                try:
+                    err_msg = "; ".join(
+                        f"{e.get('title','')}: {e.get('detail','')}" for e in data["errors"]
+                    )
+                except Exception:
                     err_msg = str(data)[:200]
-                return None, f"HTTP {status}: {err_msg}", status
-            return data, None, status
+            if not err_msg:
+                err_msg = str(data)[:200]
+            return None, f"HTTP {status}: {err_msg}", status
+        return data, None, status
 
 async def x_get_user_by_handle(handle: str):
     """Returns (data_dict, error_text). data_dict has {'id','name','username'} when OK."""
@@ -192,17 +240,14 @@ async def x_track(update: Update, context: ContextTypes.DEFAULT_TYPE):
         display = user.get("name") or handle
 
         # Save account
-        x_add_account(chat_id, handle, user_id, display)
+        await asyncio.to_thread(x_add_account, chat_id, handle, user_id, display)
 
         # Seed follower cache (avoid spamming historical followers)
         followers, f_err = await x_get_followers(user_id, max_results=200)
         if f_err:
             logging.error(f"Seeding followers failed for @{handle}: {f_err}")
         else:
-            for f in followers:
-                fid = f.get("id")
-                if fid:
-                    x_add_follower(user_id, fid)
+            await asyncio.to_thread(x_add_followers, user_id, [f["id"] for f in followers if f.get("id")])
 
         await update.message.reply_text(f"✅ Now watching @{handle} for new followers.")
 
@@ -216,12 +261,12 @@ async def x_untrack(update: Update, context: ContextTypes.DEFAULT_TYPE):
         return
     handle = context.args[0].strip().lstrip("@")
     chat_id = update.effective_chat.id
-    x_remove_account(chat_id, handle)
+    await asyncio.to_thread(x_remove_account, chat_id, handle)
     await update.message.reply_text(f"🗑 Stopped watching @{handle}.")
 
 async def x_list(update: Update, context: ContextTypes.DEFAULT_TYPE):
     chat_id = update.effective_chat.id
-    rows = x_list_accounts(chat_id)
+    rows = await asyncio.to_thread(x_list_accounts, chat_id)
     if not rows:
         await update.message.reply_text("No X accounts tracked.")
         return
@@ -249,76 +294,93 @@ async def x_testuser(update: Update, context: ContextTypes.DEFAULT_TYPE):
     url = f"{X_API_BASE}/users/by/username/{handle}"
     params = {"user.fields": "name,username"}
     try:
-        async with aiohttp.ClientSession() as s:
-            async with s.get(url, headers=HEADERS, params=params) as r:
-                body = await r.text()
-                preview = (body[:600] + "…") if len(body) > 600 else body
-                await update.message.reply_text(
-                    f"HTTP {r.status}\nURL: {url}\nAuth header ok: {bool(X_BEARER_TOKEN)}\n\nBody:\n{preview}"
-                )
+        s = await _get_http()
+        async with s.get(url, params=params) as r:
+            body = await r.text()
+            preview = (body[:600] + "…") if len(body) > 600 else body
+            await update.message.reply_text(
+                f"HTTP {r.status}\nURL: {url}\nAuth header ok: {bool(X_BEARER_TOKEN)}\n\nBody:\n{preview}"
+            )
     except Exception as e:
         await update.message.reply_text(f"Exception during call: {e}")
 
 # ========= POLLING JOB =========
+X_POLL_CONCURRENCY = 5  # follower lookups in flight at once; X rate-limits this endpoint per app
+
+def _follower_alert(handle: str, display: str, f: dict) -> Tuple[str, InlineKeyboardMarkup]:
+    fid = f.get("id")
+    fname = f.get("name") or ""
+    fuser = f.get("username") or ""
+    verified = " ✅" if f.get("verified") else ""
+    metrics = f.get("public_metrics") or {}
+    f_count = fmt_num(metrics.get("followers_count", 0))
+    p_count = fmt_num(metrics.get("tweet_count", 0))
+
+    title = f"🐦 New Follower for @{handle}!"
+    text = (
+        f"{title}\n\n"
+        f"{fname}{verified} (@{fuser}) just followed {display} (@{handle}).\n"
+        f"Followers: {f_count} | Posts: {p_count}"
+    )
+
+    profile_url = f"https://x.com/{fuser}" if fuser else f"https://x.com/i/user/{fid}"
+    acct_url = f"https://x.com/{handle}"
+    sentrip_url = "https://x.com/Sentrip_Bot"
+
+    buttons = [
+        [
+            InlineKeyboardButton("View Follower", url=profile_url),
+            InlineKeyboardButton(f"@{handle}", url=acct_url),
+        ],
+        [InlineKeyboardButton("Follow Sentrip on X", url=sentrip_url)],
+    ]
+    return text, InlineKeyboardMarkup(buttons)
+
+async def _poll_account(context: ContextTypes.DEFAULT_TYPE, user_id: str, chats: List[Tuple[int, str, str]], sem: asyncio.Semaphore):
+    handle = chats[0][1]
+    async with sem:
+        followers, err = await x_get_followers(user_id, max_results=200)
+    if err or not followers:
+        if err:
+            logging.error(f"X followers fetch failed for @{handle}: {err}")
+        return
+
+    by_id = {f["id"]: f for f in followers if f.get("id")}
+    known = await asyncio.to_thread(x_known_followers, user_id, list(by_id))
+    fresh = [f for fid, f in by_id.items() if fid not in known]
+    if not fresh:
+        return
+    await asyncio.to_thread(x_add_followers, user_id, [f["id"] for f in fresh])
+
+    # New followers! (seen-state is per X account, so alert every watching chat now)
+    for f in fresh:
+        for chat_id, chat_handle, display in chats:
+            text, markup = _follower_alert(chat_handle, display, f)
+            try:
+                await context.bot.send_message(chat_id, text, reply_markup=markup)
+            except Exception as e:
+                logging.error(f"X alert send failed for @{chat_handle} in {chat_id}: {e}")
+
 async def poll_x_followers(context: ContextTypes.DEFAULT_TYPE):
     if not X_BEARER_TOKEN:
         return
 
-    conn = sqlite3.connect(DB_PATH)
-    c = conn.cursor()
-    c.execute("SELECT chat_id, handle, user_id, display FROM x_accounts")
-    rows = c.fetchall()
-    conn.close()
+    rows = await asyncio.to_thread(x_all_accounts)
 
+    # One followers request per X account, however many chats watch it
+    watchers: Dict[str, List[Tuple[int, str, str]]] = {}
     for chat_id, handle, user_id, display in rows:
-        try:
-            followers, err = await x_get_followers(user_id, max_results=200)
-            if err or not followers:
-                if err:
-                    logging.error(f"X followers fetch failed for @{handle}: {err}")
-                continue
-
-            for f in followers:
-                fid = f.get("id")
-                if not fid:
-                    continue
-                if x_has_follower(user_id, fid):
-                    continue  # already seen
-
-                # New follower!
-                x_add_follower(user_id, fid)
-
-                fname = f.get("name") or ""
-                fuser = f.get("username") or ""
-                verified = " ✅" if f.get("verified") else ""
-                metrics = f.get("public_metrics") or {}
-                f_count = fmt_num(metrics.get("followers_count", 0))
-                p_count = fmt_num(metrics.get("tweet_count", 0))
-
-                title = f"🐦 New Follower for @{handle}!"
-                text = (
-                    f"{title}\n\n"
-                    f"{fname}{verified} (@{fuser}) just followed {display} (@{handle}).\n"
-                    f"Followers: {f_count} | Posts: {p_count}"
-                )
-
-                profile_url = f"https://x.com/{fuser}" if fuser else f"https://x.com/i/user/{fid}"
-                acct_url = f"https://x.com/{handle}"
-                sentrip_url = "https://x.com/Sentrip_Bot"
-
-                buttons = [
-                    [
-                        InlineKeyboardButton("View Follower", url=profile_url),
-                        InlineKeyboardButton(f"@{handle}", url=acct_url),
-                    ],
-                    [InlineKeyboardButton("Follow Sentrip on X", url=sentrip_url)],
-                ]
-                markup = InlineKeyboardMarkup(buttons)
+        watchers.setdefault(user_id, []).append((chat_id, handle, display))
 
-                await context.bot.send_message(chat_id, text, reply_markup=markup)
-
-        except Exception as e:
-            logging.error(f"X poll error for @{handle}: {e}")
+    sem = asyncio.Semaphore(X_POLL_CONCURRENCY)
+    items = list(watchers.items())
+    results = await asyncio.gather(
+        *(_poll_account(context, user_id, chats, sem) for user_id, chats in items),
+        return_exceptions=True,
+    )
+    for (user_id, chats), res in zip(items, results):
+        if isinstance(res, Exception):
+            logging.error(f"X poll error for @{chats[0][1]}: {res}")
 
 # ========= REGISTER =========
 def register_x_alert(app):
@@ -329,3 +391,10 @@ def register_x_alert(app):
     app.add_handler(CommandHandler("x_debug", x_debug))
     app.add_handler(CommandHandler("x_testuser", x_testuser))
     app.job_queue.run_repeating(poll_x_followers, interval=120, first=10)
+
+    prev_shutdown = app.post_shutdown
+    async def _post_shutdown(application):
+        if prev_shutdown:
+            await prev_shutdown(application)
+        await _close_http()
+    app.post_shutdown = _post_shutdown